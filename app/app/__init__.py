@@ -0,0 +1,4 @@
+# Load the Celery app whenever Django starts, so tasks sent from web processes use its settings and routes.
+from .celery import app as celery_app
+
+__all__ = ("celery_app",)
@@ -1,6 +1,8 @@
 import os
 
 from celery import Celery
+from celery.signals import worker_init
+from celery.signals import worker_process_shutdown
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
@@ -15,3 +17,17 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    from users.metrics import start_worker_metrics_server
+
+    start_worker_metrics_server()
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    from users.metrics import mark_process_dead
+
+    mark_process_dead(pid or os.getpid())
@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 
 from dotenv import load_dotenv
+from kombu import Queue
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "debug_toolbar",
     "users.apps.UsersConfig",
     "django.contrib.sites",
@@ -65,6 +67,7 @@ ACCOUNT_EMAIL_VERIFICATION = "none"
 ACCOUNT_EMAIL_REQUIRED = False
 
 SOCIALACCOUNT_STORE_TOKENS = True
+SOCIALACCOUNT_ADAPTER = "users.adapter.SocialAccountAdapter"
 SOCIALACCOUNT_PROVIDERS = {
     "github": {
         "SCOPE": ["read:user", "user:email", "repo"],
@@ -72,6 +75,7 @@ SOCIALACCOUNT_PROVIDERS = {
 }
 
 MIDDLEWARE = [
+    "users.middleware.MetricsMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -115,10 +119,32 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("DB_HOST"),
         "PORT": "5432",
+        # Keep connections open between requests and check them before reuse instead of reconnecting every time.
+        "CONN_MAX_AGE": int(os.environ.get("CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+if os.environ.get("CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["CACHE_URL"],
+        }
+    }
+
+REPOS_PAGE_CACHE_TIMEOUT = int(os.environ.get("REPOS_PAGE_CACHE_TIMEOUT", 60 * 60 * 24))
+# Social apps (without their secrets) and accounts are cached for LOOKUP_CACHE_TIMEOUT seconds and invalidated
+# on change; each process also keeps up to LOOKUP_LOCAL_MAX_ENTRIES of them for LOOKUP_LOCAL_TIMEOUT seconds.
+LOOKUP_CACHE_TIMEOUT = int(os.environ.get("LOOKUP_CACHE_TIMEOUT", 60 * 60 * 24))
+LOOKUP_LOCAL_TIMEOUT = int(os.environ.get("LOOKUP_LOCAL_TIMEOUT", 5))
+LOOKUP_LOCAL_MAX_ENTRIES = int(os.environ.get("LOOKUP_LOCAL_MAX_ENTRIES", 1024))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -172,6 +198,89 @@ CSRF_TRUSTED_ORIGINS = [x.strip() for x in os.environ["CSRF_TRUSTED_ORIGINS"].sp
 
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND")
+# Syncs a user asked for run on SYNC_INTERACTIVE_QUEUE; scheduled syncs and compaction run on SYNC_BULK_QUEUE,
+# everything else on the default "celery" queue. Each lane has its own workers (see docker-compose.yaml),
+# which reserve one task at a time so a long sync never holds back tasks another worker could start.
+SYNC_INTERACTIVE_QUEUE = os.environ.get("SYNC_INTERACTIVE_QUEUE", "interactive")
+SYNC_BULK_QUEUE = os.environ.get("SYNC_BULK_QUEUE", "bulk")
+# Declared up front, so every process (not only the ones that already sent to a lane) knows all of them,
+# and the queue length metric reports each lane.
+CELERY_TASK_QUEUES = [Queue(name) for name in ("celery", SYNC_INTERACTIVE_QUEUE, SYNC_BULK_QUEUE)]
+CELERY_TASK_ROUTES = {
+    "users.tasks.sync_repos": {"queue": SYNC_BULK_QUEUE},
+    "users.tasks.compact_repos": {"queue": SYNC_BULK_QUEUE},
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get("CELERY_WORKER_PREFETCH_MULTIPLIER", 1))
+CELERY_BEAT_SCHEDULE = {
+    "schedule-stale-syncs": {
+        "task": "users.tasks.schedule_stale_syncs",
+        "schedule": int(os.environ.get("SYNC_SCHEDULER_INTERVAL", 300)),
+    },
+    # Deliveries schedule their own batch; this picks up events left behind by a lost task.
+    "apply-webhook-events": {
+        "task": "users.tasks.apply_webhook_events",
+        "schedule": int(os.environ.get("GITHUB_WEBHOOK_SWEEP_INTERVAL", 60)),
+    },
+    "compact-repos": {
+        "task": "users.tasks.compact_repos",
+        "schedule": int(os.environ.get("COMPACTION_INTERVAL", 60 * 60)),
+    },
+}
+
+# A user has at most one running sync (SYNC_LOCK_TIMEOUT) and one queued sync (SYNC_QUEUED_TIMEOUT).
+SYNC_LOCK_TIMEOUT = int(os.environ.get("SYNC_LOCK_TIMEOUT", 15 * 60))
+SYNC_LOCK_RETRY_DELAY = int(os.environ.get("SYNC_LOCK_RETRY_DELAY", 10))
+SYNC_QUEUED_TIMEOUT = int(os.environ.get("SYNC_QUEUED_TIMEOUT", 60 * 60))
+
+# Every scheduler run releases at most SYNC_SCHEDULER_MAX_USERS syncs,
+# SYNC_SCHEDULER_BATCH_SIZE of them every SYNC_SCHEDULER_BATCH_INTERVAL seconds.
+SYNC_SCHEDULER_MAX_USERS = int(os.environ.get("SYNC_SCHEDULER_MAX_USERS", 2000))
+SYNC_SCHEDULER_BATCH_SIZE = int(os.environ.get("SYNC_SCHEDULER_BATCH_SIZE", 100))
+SYNC_SCHEDULER_BATCH_INTERVAL = int(os.environ.get("SYNC_SCHEDULER_BATCH_INTERVAL", 15))
+SYNC_SCHEDULER_MIN_AGE = int(os.environ.get("SYNC_SCHEDULER_MIN_AGE", 60 * 60))
+SYNC_SCHEDULER_SUMMARY_DELAY = int(os.environ.get("SYNC_SCHEDULER_SUMMARY_DELAY", 120))
+SYNC_SCHEDULER_SUMMARY_TTL = 60 * 60 * 24
+
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+GITHUB_TIMEOUT = int(os.environ.get("GITHUB_TIMEOUT", 10))
+GITHUB_FETCH_WORKERS = int(os.environ.get("GITHUB_FETCH_WORKERS", 8))
+# Requests stop once fewer than GITHUB_RATE_LIMIT_RESERVE calls are left for a token;
+# the circuit breaker opens after GITHUB_BREAKER_THRESHOLD failures within GITHUB_BREAKER_WINDOW seconds.
+GITHUB_RATE_LIMIT_RESERVE = int(os.environ.get("GITHUB_RATE_LIMIT_RESERVE", 100))
+GITHUB_THROTTLED_MAX_RETRIES = int(os.environ.get("GITHUB_THROTTLED_MAX_RETRIES", 24))
+GITHUB_RETRY_BACKOFF_BASE = int(os.environ.get("GITHUB_RETRY_BACKOFF_BASE", 5))
+GITHUB_RETRY_BACKOFF_MAX = int(os.environ.get("GITHUB_RETRY_BACKOFF_MAX", 300))
+GITHUB_BREAKER_THRESHOLD = int(os.environ.get("GITHUB_BREAKER_THRESHOLD", 5))
+GITHUB_BREAKER_WINDOW = int(os.environ.get("GITHUB_BREAKER_WINDOW", 60))
+GITHUB_BREAKER_COOLDOWN = int(os.environ.get("GITHUB_BREAKER_COOLDOWN", 120))
+GITHUB_SYNC_STREAMING = os.environ.get("GITHUB_SYNC_STREAMING", "false").lower() in ("true", "1", "yes")
+GITHUB_SYNC_CHUNK_SIZE = int(os.environ.get("GITHUB_SYNC_CHUNK_SIZE", 500))
+# Between full reconciles, which also catch deleted repos, syncs only read repos updated since the last one.
+GITHUB_RECONCILE_INTERVAL = int(os.environ.get("GITHUB_RECONCILE_INTERVAL", 60 * 60 * 24))
+# Repos written by any sync within GITHUB_REPO_REFRESH_TTL seconds are only rewritten by a newer updated_at.
+GITHUB_REPO_REFRESH_TTL = int(os.environ.get("GITHUB_REPO_REFRESH_TTL", 5 * 60))
+# Webhook deliveries are signed with GITHUB_WEBHOOK_SECRET (the endpoint answers 404 without one) and
+# applied in batches of up to GITHUB_WEBHOOK_BATCH_SIZE events, GITHUB_WEBHOOK_BATCH_DELAY seconds after the
+# first delivery; GITHUB_WEBHOOK_QUEUED_TIMEOUT bounds how long a lost scheduled batch blocks the next one.
+GITHUB_WEBHOOK_SECRET = os.environ.get("GITHUB_WEBHOOK_SECRET", "")
+GITHUB_WEBHOOK_BATCH_SIZE = int(os.environ.get("GITHUB_WEBHOOK_BATCH_SIZE", 500))
+GITHUB_WEBHOOK_BATCH_DELAY = int(os.environ.get("GITHUB_WEBHOOK_BATCH_DELAY", 2))
+GITHUB_WEBHOOK_QUEUED_TIMEOUT = int(os.environ.get("GITHUB_WEBHOOK_QUEUED_TIMEOUT", 60))
+
+# Compaction deletes links disabled for COMPACTION_LINK_RETENTION seconds and repos that nothing links to,
+# COMPACTION_BATCH_SIZE rows per transaction and at most COMPACTION_MAX_BATCHES batches per table and run,
+# scheduling each batch COMPACTION_BATCH_PAUSE seconds plus the duration of the last one after it. A run that
+# makes no progress for COMPACTION_RUN_TIMEOUT seconds counts as lost and the next scheduled one starts over.
+COMPACTION_LINK_RETENTION = int(os.environ.get("COMPACTION_LINK_RETENTION", 60 * 60 * 24 * 30))
+COMPACTION_BATCH_SIZE = int(os.environ.get("COMPACTION_BATCH_SIZE", 1000))
+COMPACTION_MAX_BATCHES = int(os.environ.get("COMPACTION_MAX_BATCHES", 200))
+COMPACTION_BATCH_PAUSE = float(os.environ.get("COMPACTION_BATCH_PAUSE", 0.5))
+COMPACTION_RUN_TIMEOUT = int(os.environ.get("COMPACTION_RUN_TIMEOUT", 15 * 60))
+
+# /metrics requires "Authorization: Bearer <METRICS_TOKEN>" when the token is set. Celery workers serve
+# their own metrics on CELERY_METRICS_PORT (0 disables); set PROMETHEUS_MULTIPROC_DIR for multi-process servers.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+CELERY_METRICS_PORT = int(os.environ.get("CELERY_METRICS_PORT", 9808))
 
 if DEBUG:
     DEBUG_TOOLBAR_CONFIG = {
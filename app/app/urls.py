@@ -19,8 +19,10 @@ from debug_toolbar.toolbar import debug_toolbar_urls
 from django.contrib import admin
 from django.urls import include
 from django.urls import path
+from users.views import metrics
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("users/", include("users.urls")),
+    path("metrics", metrics, name="metrics"),
 ] + debug_toolbar_urls()
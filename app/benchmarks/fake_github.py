@@ -0,0 +1,149 @@
+"""A local stand-in for the parts of the GitHub REST API that ``sync_repos`` uses.
+
+Serves ``GET /user/repos`` for bearer tokens registered with :meth:`FakeGitHub.add_user`,
+with ``Link`` pagination, ``ETag``/``If-None-Match`` revalidation, rate limit headers
+and an optional per-request latency.
+"""
+
+import hashlib
+import json
+import math
+import threading
+import time
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any
+from typing import Dict
+from typing import List
+from urllib.parse import parse_qs
+from urllib.parse import urlencode
+from urllib.parse import urlparse
+
+RATE_LIMIT = 5000
+EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def timestamp(seconds: int) -> str:
+    return (EPOCH + timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def make_repo(github_id: int, owner: str) -> Dict[str, Any]:
+    return {
+        "id": github_id,
+        "name": f"repo-{github_id}",
+        "full_name": f"{owner}/repo-{github_id}",
+        "html_url": f"https://github.com/{owner}/repo-{github_id}",
+        "description": f"Benchmark repository {github_id}",
+        "stargazers_count": github_id % 1000,
+        "forks_count": github_id % 50,
+        "language": ("Python", "Go", "Rust", None)[github_id % 4],
+        "private": github_id % 7 == 0,
+        "updated_at": timestamp(github_id),
+        "pushed_at": timestamp(github_id),
+    }
+
+
+class FakeGitHub:
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.repos: Dict[str, List[Dict[str, Any]]] = {}
+        self.requests = 0
+        self.clock = 10**6
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGitHub":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeGitHub":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def add_user(self, token: str, repos: List[Dict[str, Any]]) -> None:
+        self.repos[token] = repos
+
+    def change(self, fraction: float) -> int:
+        """Star ``fraction`` of every user's repos, which also moves their ``updated_at``; returns the count."""
+        changed = 0
+        for repos in self.repos.values():
+            if not fraction:
+                break
+            for repo in repos[:: max(round(1 / fraction), 1)]:
+                self.clock += 1
+                repo["stargazers_count"] += 1
+                repo["updated_at"] = timestamp(self.clock)
+                changed += 1
+        return changed
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                url = urlparse(self.path)
+                token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+                if url.path != "/user/repos" or token not in fake.repos:
+                    self.send_response(HTTPStatus.NOT_FOUND if token in fake.repos else HTTPStatus.UNAUTHORIZED)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                query = parse_qs(url.query)
+                per_page = int(query.get("per_page", ["30"])[0])
+                page = int(query.get("page", ["1"])[0])
+                repos = fake.repos[token]
+                if query.get("sort") == ["updated"]:
+                    newest_first = query.get("direction", ["desc"]) == ["desc"]
+                    repos = sorted(repos, key=lambda repo: repo["updated_at"], reverse=newest_first)
+                last = max(math.ceil(len(repos) / per_page), 1)
+                body = json.dumps(repos[(page - 1) * per_page : page * per_page]).encode()
+                etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+
+                status = HTTPStatus.NOT_MODIFIED if self.headers.get("If-None-Match") == etag else HTTPStatus.OK
+                self.send_response(status)
+                self.send_header("ETag", etag)
+                self.send_header("X-RateLimit-Limit", str(RATE_LIMIT))
+                self.send_header("X-RateLimit-Remaining", str(RATE_LIMIT - 1))
+                self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+                links = []
+                base = f"{fake.url}/user/repos?" + urlencode({k: v[0] for k, v in query.items() if k != "page"})
+                if page < last:
+                    links.append(f'<{base}&page={page + 1}>; rel="next"')
+                    links.append(f'<{base}&page={last}>; rel="last"')
+                if links:
+                    self.send_header("Link", ", ".join(links))
+                if status == HTTPStatus.NOT_MODIFIED:
+                    self.end_headers()
+                    return
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
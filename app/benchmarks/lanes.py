@@ -0,0 +1,112 @@
+"""Measure how long user-triggered syncs wait while scheduled syncs keep every bulk worker busy.
+
+Runs embedded Celery workers on an in-memory broker. Sleep tasks stand in for syncs and are sent the way
+``sync_repos`` is: scheduled ones to ``SYNC_BULK_QUEUE``, user-triggered ones to ``SYNC_INTERACTIVE_QUEUE``.
+``shared`` puts all of them on one queue served by one worker of the same total concurrency, as before the
+lanes existed; ``lanes`` runs one worker per lane as in docker-compose.yaml::
+
+    cd app
+    python -m benchmarks.lanes --bulk 200 --interactive 40
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from contextlib import ExitStack
+from typing import Dict
+from typing import List
+
+import django
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def run(mode: str, args: argparse.Namespace) -> Dict[str, float]:
+    from celery.contrib.testing.worker import start_worker
+    from django.conf import settings
+
+    from app.celery import app
+
+    # The in-memory transport polls once a second by default, which would hide the queueing itself.
+    app.conf.broker_transport_options = {"polling_interval": 0.01}
+    started_at = {}
+    finished = set()
+
+    @app.task(name=f"benchmarks.lanes.fake_sync_{mode}", ignore_result=True)
+    def fake_sync(kind: str, number: int, duration: float):
+        started_at[(kind, number)] = time.perf_counter()
+        time.sleep(duration)
+        finished.add((kind, number))
+
+    if mode == "shared":
+        lanes = [([app.conf.task_default_queue], args.bulk_concurrency + args.interactive_concurrency)]
+        bulk_queue = interactive_queue = app.conf.task_default_queue
+    else:
+        lanes = [
+            ([settings.SYNC_BULK_QUEUE, app.conf.task_default_queue], args.bulk_concurrency),
+            ([settings.SYNC_INTERACTIVE_QUEUE], args.interactive_concurrency),
+        ]
+        bulk_queue, interactive_queue = settings.SYNC_BULK_QUEUE, settings.SYNC_INTERACTIVE_QUEUE
+
+    sent_at = {}
+    with ExitStack() as stack:
+        for queues, concurrency in lanes:
+            # One single-process worker per slot: embedded thread-pool workers only acknowledge between two
+            # polls of the broker, which would add up to a second to every task.
+            for _ in range(concurrency):
+                stack.enter_context(
+                    start_worker(app, pool="solo", queues=queues, perform_ping_check=False, shutdown_timeout=10)
+                )
+        # A scheduler run releases its backlog at once; users then trigger syncs at a steady rate behind it.
+        for number in range(args.bulk):
+            fake_sync.apply_async(("bulk", number, args.bulk_duration), queue=bulk_queue)
+        for number in range(args.interactive):
+            sent_at[("interactive", number)] = time.perf_counter()
+            fake_sync.apply_async(("interactive", number, args.interactive_duration), queue=interactive_queue)
+            time.sleep(args.interval)
+        deadline = time.monotonic() + args.timeout
+        while len(finished) < args.bulk + args.interactive and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    waits = [started_at[key] - sent for key, sent in sent_at.items() if key in started_at]
+    if len(waits) < args.interactive:
+        raise RuntimeError(f"{mode}: only {len(waits)} of {args.interactive} interactive syncs started in time")
+    result = {
+        "interactive_wait_p50_s": round(statistics.median(waits), 3),
+        "interactive_wait_p95_s": round(percentile(waits, 95), 3),
+        "interactive_wait_max_s": round(max(waits), 3),
+    }
+    print(f"{mode:>8}: " + "  ".join(f"{name} {value:.3f}" for name, value in result.items()))
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bulk", type=int, default=200, help="scheduled syncs queued up front")
+    parser.add_argument("--interactive", type=int, default=40, help="user-triggered syncs sent behind them")
+    parser.add_argument("--bulk-duration", type=float, default=0.2, help="seconds per scheduled sync")
+    parser.add_argument("--interactive-duration", type=float, default=0.05, help="seconds per user-triggered sync")
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between user-triggered syncs")
+    parser.add_argument("--bulk-concurrency", type=int, default=2)
+    parser.add_argument("--interactive-concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--mode", choices=("shared", "lanes", "both"), default="both")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+    os.environ["CELERY_BROKER_URL"] = "memory://"
+    os.environ["CELERY_METRICS_PORT"] = "0"
+    django.setup()
+
+    modes = ("shared", "lanes") if args.mode == "both" else (args.mode,)
+    results = {mode: run(mode, args) for mode in modes}
+    print(json.dumps({"params": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
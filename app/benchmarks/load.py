@@ -0,0 +1,350 @@
+"""Load-test one app node over HTTP: gunicorn, a Celery worker, Postgres, the cache and a fake GitHub API.
+
+Seeds a throwaway test database through ``benchmarks.run``, starts gunicorn and a worker against it,
+then runs stages of logged-in sessions that browse ``github_repos`` (following "Next" links or jumping
+to another ``page_num``/``page_size``) and now and then POST ``trigger_sync_repos``. Every stage reports
+throughput, latency percentiles and the error rate per endpoint. The capacity is the largest number of
+concurrent sessions whose repos page p95 stays within ``--slo-p95`` milliseconds with at most
+``--max-error-rate`` errors::
+
+    docker compose up -d postgres redis
+    cd app
+    export CACHE_URL=redis://localhost:6379/1 CELERY_BROKER_URL=redis://localhost:6379/0
+    python -m benchmarks.load --users 50 --repos 300 --concurrency 1,5,10,20,40 --duration 20
+
+Results are written like those of ``benchmarks.run`` and compare the same way.
+"""
+
+import argparse
+import html
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from collections import defaultdict
+from datetime import datetime
+from datetime import timezone
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import django
+import requests
+from django.urls import reverse
+
+from .run import RESULTS_DIR
+from .run import git_commit
+from .run import run_syncs
+from .run import seed_users
+
+APP_DIR = Path(__file__).resolve().parent.parent
+PAGE_SIZES = (10, 25, 50, 100)
+NEXT_LINK = re.compile(r'href="(\?[^"]*&after=[^"]*)"')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def enable_login_page() -> None:
+    """Create the configured site and enable the seeded GitHub app on it, as a real deployment has them."""
+    from allauth.socialaccount.models import SocialApp
+    from django.conf import settings
+    from django.contrib.sites.models import Site
+
+    site, _ = Site.objects.get_or_create(pk=settings.SITE_ID, defaults={"domain": "127.0.0.1", "name": "load"})
+    for app in SocialApp.objects.filter(provider="github"):
+        app.sites.add(site)
+
+
+def create_sessions(users) -> List[Dict[str, str]]:
+    """The cookies of a logged-in session per user, with a CSRF token for the POSTs."""
+    from django.conf import settings
+    from django.contrib.auth import BACKEND_SESSION_KEY
+    from django.contrib.auth import HASH_SESSION_KEY
+    from django.contrib.auth import SESSION_KEY
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.utils.crypto import get_random_string
+
+    sessions = []
+    for user in users:
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        csrf_token = get_random_string(32)
+        sessions.append({settings.SESSION_COOKIE_NAME: session.session_key, settings.CSRF_COOKIE_NAME: csrf_token})
+    return sessions
+
+
+class Server:
+    """gunicorn and a Celery worker serving the test database, with their output in one log file."""
+
+    def __init__(self, args: argparse.Namespace, env: Dict[str, str]):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log = tempfile.NamedTemporaryFile(prefix="load-", suffix=".log", delete=False)
+        gunicorn = [sys.executable, "-m", "gunicorn", "app.wsgi", "--bind", f"127.0.0.1:{self.port}"]
+        gunicorn += ["--workers", str(args.workers), "--threads", str(args.threads), "--access-logfile", "/dev/null"]
+        commands = [gunicorn]
+        if args.worker_concurrency:
+            from django.conf import settings
+
+            queues = ",".join((settings.SYNC_INTERACTIVE_QUEUE, settings.SYNC_BULK_QUEUE, "celery"))
+            commands.append(
+                [sys.executable, "-m", "celery", "-A", "app", "worker", "-l", "WARNING", "-Q", queues]
+                + ["-c", str(args.worker_concurrency)]
+            )
+        self.processes = [
+            subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+            for command in commands
+        ]
+
+    def wait_ready(self, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(process.poll() is not None for process in self.processes):
+                break
+            try:
+                if requests.get(self.url + reverse("login_github"), timeout=5).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"the app did not come up, see {self.log.name}")
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.log.close()
+
+
+class Session(threading.Thread):
+    """One user clicking through their repos until ``stop_at``, without think time unless asked for."""
+
+    def __init__(self, url: str, cookies: Dict[str, str], args: argparse.Namespace, stop_at: float, seed: int):
+        from django.conf import settings
+
+        super().__init__(daemon=True)
+        self.url = url
+        self.repos_path = reverse("github_repos")
+        self.trigger_path = reverse("trigger_sync_repos")
+        self.args = args
+        self.stop_at = stop_at
+        self.random = random.Random(seed)
+        self.http = requests.Session()
+        self.http.cookies.update(cookies)
+        self.csrf_token = cookies[settings.CSRF_COOKIE_NAME]
+        self.next_page: Optional[str] = None
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    def run(self) -> None:
+        while time.monotonic() < self.stop_at:
+            if self.random.random() < self.args.trigger_rate:
+                self.request("trigger_sync_repos", "post", self.trigger_path, headers={"X-CSRFToken": self.csrf_token})
+            else:
+                self.browse()
+            if self.args.think:
+                time.sleep(self.random.uniform(0, 2 * self.args.think))
+
+    def browse(self) -> None:
+        if self.next_page and self.random.random() < 0.7:
+            # Follow the page's own "Next" link, cursor included.
+            resp = self.request("github_repos", "get", self.repos_path + html.unescape(self.next_page))
+        else:
+            page_size = self.random.choice(PAGE_SIZES)
+            last_page = max(self.args.repos // page_size, 1)
+            params = {"page_size": page_size, "page_num": self.random.randint(1, min(last_page, 5))}
+            resp = self.request("github_repos", "get", self.repos_path, params=params)
+        match = NEXT_LINK.search(resp.text) if resp is not None and resp.ok else None
+        self.next_page = match[1] if match else None
+
+    def request(self, endpoint: str, method: str, path: str, **kwargs) -> Optional[requests.Response]:
+        started = time.perf_counter()
+        try:
+            # A lost session redirects to the login page, which must count as a failure rather than a fast page.
+            resp = self.http.request(
+                method, self.url + path, timeout=self.args.timeout, allow_redirects=False, **kwargs
+            )
+        except requests.RequestException as exc:
+            self.statuses[endpoint][type(exc).__name__] += 1
+            return None
+        finally:
+            self.timings[endpoint].append(time.perf_counter() - started)
+        self.statuses[endpoint][str(resp.status_code)] += 1
+        return resp
+
+
+def is_error(endpoint: str, status: str) -> bool:
+    if not status.isdigit():
+        return True
+    # The sync trigger allows one POST a minute per user and answers the rest with a 429 by design. Any other
+    # 4xx, a 403 from a lost session or CSRF check included, is a failure.
+    if endpoint == "trigger_sync_repos" and int(status) == HTTPStatus.TOO_MANY_REQUESTS:
+        return False
+    return not (200 <= int(status) < 300 or int(status) == HTTPStatus.NOT_MODIFIED)
+
+
+def run_stage(url: str, sessions: List[Dict[str, str]], concurrency: int, args: argparse.Namespace) -> Dict[str, Any]:
+    stop_at = time.monotonic() + args.duration
+    workers = [
+        Session(url, sessions[number % len(sessions)], args, stop_at, seed=concurrency * 1000 + number)
+        for number in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    stage = {}
+    for endpoint in ("github_repos", "trigger_sync_repos"):
+        timings = [timing for worker in workers for timing in worker.timings[endpoint]]
+        statuses = sum((worker.statuses[endpoint] for worker in workers), Counter())
+        if not timings:
+            continue
+        errors = sum(count for status, count in statuses.items() if is_error(endpoint, status))
+        stage[endpoint] = {
+            "requests": len(timings),
+            "rps": round(len(timings) / elapsed, 1),
+            "p50_ms": round(statistics.median(timings) * 1000, 1),
+            "p90_ms": round(percentile(timings, 90) * 1000, 1),
+            "p95_ms": round(percentile(timings, 95) * 1000, 1),
+            "p99_ms": round(percentile(timings, 99) * 1000, 1),
+            "error_rate": round(errors / len(timings), 4),
+        }
+        print(
+            f"{concurrency:>4} sessions {endpoint:>18}: {stage[endpoint]['rps']:8.1f} req/s"
+            f"  p50 {stage[endpoint]['p50_ms']:7.1f}  p95 {stage[endpoint]['p95_ms']:7.1f}"
+            f"  p99 {stage[endpoint]['p99_ms']:7.1f} ms  errors {stage[endpoint]['error_rate']:.2%}  {dict(statuses)}"
+        )
+    return stage
+
+
+def within_slo(stage: Dict[str, Any], args: argparse.Namespace) -> bool:
+    page = stage.get("github_repos")
+    if page is None or page["p95_ms"] > args.slo_p95:
+        return False
+    return all(metrics["error_rate"] <= args.max_error_rate for metrics in stage.values())
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from django.conf import settings
+    from django.db import connection
+    from django.test import override_settings
+
+    from .fake_github import FakeGitHub
+
+    if settings.CELERY_BROKER_URL in (None, "") or settings.CELERY_BROKER_URL.startswith("memory://"):
+        print("warning: CELERY_BROKER_URL is not shared between processes, triggered syncs will never run")
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    results: Dict[str, Any] = {}
+    server = None
+    try:
+        with FakeGitHub(latency=args.latency) as fake:
+            with override_settings(GITHUB_API_URL=fake.url):
+                users = seed_users(fake, args.users, args.repos)
+                run_syncs(users)
+            enable_login_page()
+            sessions = create_sessions(users)
+            env = dict(
+                os.environ,
+                POSTGRES_DB=connection.settings_dict["NAME"],
+                GITHUB_API_URL=fake.url,
+                ALLOWED_HOSTS=os.environ.get("ALLOWED_HOSTS", "") + ",127.0.0.1",
+                DEBUG="False",
+                CELERY_METRICS_PORT="0",
+            )
+            env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+            # Neither gunicorn nor the worker may keep the test database open once the run is over.
+            connection.close()
+            server = Server(args, env)
+            server.wait_ready()
+            capacity = {"concurrency": 0, "rps": 0.0}
+            for concurrency in args.concurrency:
+                stage = run_stage(server.url, sessions, concurrency, args)
+                for endpoint, metrics in stage.items():
+                    results[f"c{concurrency}:{endpoint}"] = metrics
+                if within_slo(stage, args):
+                    capacity = {"concurrency": concurrency, "rps": stage["github_repos"]["rps"]}
+                elif args.stop_past_slo:
+                    break
+            results["capacity"] = capacity
+            results["github_requests"] = fake.requests
+    finally:
+        if server is not None:
+            server.stop()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    print(f"capacity: {results.get('capacity')} (repos page p95 <= {args.slo_p95:g} ms)")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--repos", type=int, default=200, help="repos per user")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake GitHub latency per request, seconds")
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(part) for part in value.split(",")],
+        default=[1, 5, 10, 20, 40],
+        help="comma separated numbers of concurrent sessions, one stage each",
+    )
+    parser.add_argument("--duration", type=float, default=15, help="seconds per stage")
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds between a session's requests")
+    parser.add_argument("--trigger-rate", type=float, default=0.02, help="share of requests that trigger a sync")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as an error")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--worker-concurrency", type=int, default=2, help="Celery worker processes (0: none)")
+    parser.add_argument("--slo-p95", type=float, default=500, help="repos page p95 target, milliseconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--stop-past-slo", action="store_true", help="skip the remaining stages once one misses")
+    parser.add_argument("--output", type=Path, default=None, help="result file (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+    django.setup()
+    results = run(args)
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "params": {name: value for name, value in vars(args).items() if name != "output"},
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{commit}-load.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Benchmark ``sync_repos`` and ``GitHubReposView`` against a local fake GitHub API.
+
+Runs in a throwaway test database and writes the results as JSON, e.g.::
+
+    cd app
+    python -m benchmarks.run --users 20 --repos 1000 --latency 0.02
+    python -m benchmarks.run --compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+
+import django
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+@contextmanager
+def measure(results: Dict[str, Any], name: str):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        yield
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results[name] = {
+        "wall_s": round(wall, 4),
+        "queries": len(queries.captured_queries),
+        "peak_mem_mb": round(peak / 2**20, 3),
+    }
+    print(f"{name:>24}: {wall:8.3f}s {len(queries.captured_queries):7d} queries {peak / 2**20:9.2f} MB peak")
+
+
+def seed_users(fake, users: int, repos: int):
+    from allauth.socialaccount.models import SocialAccount
+    from allauth.socialaccount.models import SocialApp
+    from allauth.socialaccount.models import SocialToken
+    from django.contrib.auth import get_user_model
+
+    from .fake_github import make_repo
+
+    User = get_user_model()
+    app = SocialApp.objects.create(provider="github", name="bench", client_id="bench", secret="bench")
+    created = User.objects.bulk_create([User(username=f"bench-{i}") for i in range(users)])
+    accounts = SocialAccount.objects.bulk_create(
+        [SocialAccount(user=user, provider="github", uid=str(user.pk), extra_data={}) for user in created]
+    )
+    SocialToken.objects.bulk_create(
+        [SocialToken(app=app, account=account, token=f"token-{account.user_id}") for account in accounts]
+    )
+    for i, user in enumerate(created):
+        # Neighbouring users share half of their repos, like members of one organisation.
+        first = i * repos // 2
+        fake.add_user(f"token-{user.pk}", [make_repo(first + n + 1, f"org-{i // 2}") for n in range(repos)])
+    return created
+
+
+def run_syncs(users) -> None:
+    from users.tasks import sync_repos
+
+    for user in users:
+        result = sync_repos(user.pk)
+        if not result.get("ok"):
+            raise RuntimeError(f"sync failed for {user.pk}: {result}")
+
+
+def render_pages(client_for: Callable, users, page_size: int) -> None:
+    from django.urls import reverse
+
+    for user in users:
+        client = client_for(user)
+        first = client.get(reverse("github_repos"), {"page_size": page_size})
+        assert first.status_code == 200, first.status_code
+        cursor = first.context["repos"].next_cursor
+        if cursor:
+            resp = client.get(reverse("github_repos"), {"page_num": 2, "page_size": page_size, "after": cursor})
+            assert resp.status_code == 200, resp.status_code
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from django.test import override_settings
+    from django.test.utils import setup_test_environment
+    from django.test.utils import teardown_test_environment
+
+    from .fake_github import FakeGitHub
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    results: Dict[str, Any] = {}
+    try:
+        with (
+            FakeGitHub(latency=args.latency) as fake,
+            override_settings(GITHUB_API_URL=fake.url, GITHUB_SYNC_STREAMING=args.streaming),
+        ):
+            cache.clear()
+            users = seed_users(fake, args.users, args.repos)
+
+            with measure(results, "sync_cold"):
+                run_syncs(users)
+            with measure(results, "sync_noop"):
+                run_syncs(users)
+            fake.change(0.1)
+            with measure(results, "sync_10pct_changed"):
+                run_syncs(users)
+
+            def client_for(user):
+                client = Client()
+                client.force_login(user)
+                return client
+
+            cache.clear()
+            with measure(results, "render_cold"):
+                render_pages(client_for, users, args.page_size)
+            with measure(results, "render_cached"):
+                render_pages(client_for, users, args.page_size)
+            results["github_requests"] = fake.requests
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old_path: str, new_path: str) -> None:
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    print(f"{old['commit']} -> {new['commit']}")
+    for name, metrics in new["results"].items():
+        if not isinstance(metrics, dict) or name not in old["results"]:
+            continue
+        changes = []
+        for metric, value in metrics.items():
+            before = old["results"][name][metric]
+            ratio = value / before if before else float("inf") if value else 1.0
+            changes.append(f"{metric} {before} -> {value} (x{ratio:.2f})")
+        print(f"{name:>24}: " + ", ".join(changes))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--repos", type=int, default=500, help="repos per user")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake GitHub latency per request, seconds")
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--streaming", action="store_true", help="enable GITHUB_SYNC_STREAMING")
+    parser.add_argument("--output", type=Path, default=None, help="result file (default: benchmarks/results/)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+    django.setup()
+    results = run(args)
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "params": {
+            "users": args.users,
+            "repos": args.repos,
+            "latency": args.latency,
+            "page_size": args.page_size,
+            "streaming": args.streaming,
+        },
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils.dateparse import parse_datetime
+from users.github import iter_recently_updated_repos
+from users.github import iter_user_repos
+
+from .fake_github import FakeGitHub
+from .fake_github import make_repo
+
+
+@pytest.fixture
+def fake():
+    cache.clear()
+    with FakeGitHub() as server, override_settings(GITHUB_API_URL=server.url):
+        server.add_user("tok", [make_repo(i, "org") for i in range(1, 251)])
+        yield server
+    cache.clear()
+
+
+def test_client_pages_through_fake_github(fake):
+    pages = list(iter_user_repos("tok"))
+    assert [page.number for page in pages] == [1, 2, 3]
+    assert [repo["id"] for page in pages for repo in page.repos] == list(range(1, 251))
+
+
+def test_fake_github_revalidates_unchanged_pages(fake):
+    pages = list(iter_user_repos("tok"))
+    validators = {page.number: (page.etag, page.last_modified) for page in pages}
+    fake.change(1 / 250)
+    revalidated = list(iter_user_repos("tok", validators))
+    assert [page.not_modified for page in revalidated] == [False, True, True]
+    assert revalidated[1].repos is None
+
+
+def test_streamed_pages_match_decoded_pages(fake):
+    streamed = [repo for page in iter_user_repos("tok", stream=True) for repo in page.repos]
+    assert streamed == fake.repos["tok"]
+
+
+def test_recently_updated_pages_stop_at_since(fake):
+    pages = list(iter_user_repos("tok"))
+    since = max(parse_datetime(repo["updated_at"]) for page in pages for repo in page.repos)
+    fake.change(1 / 50)
+    recent = list(iter_recently_updated_repos("tok", since))
+    assert [page.number for page in recent] == [1]
+    assert [repo["id"] for repo in recent[0].repos[:5]] == [201, 151, 101, 51, 1]
@@ -0,0 +1,33 @@
+from typing import List
+
+from allauth import app_settings as allauth_settings
+from allauth.socialaccount import app_settings
+from allauth.socialaccount.adapter import DefaultSocialAccountAdapter
+from allauth.socialaccount.models import SocialApp
+from django.contrib.sites.shortcuts import get_current_site
+from django.http import HttpRequest
+
+from .lookups import social_app_secrets
+from .lookups import social_apps
+
+
+class SocialAccountAdapter(DefaultSocialAccountAdapter):
+    def list_apps(self, request: HttpRequest, provider=None, client_id=None) -> List[SocialApp]:
+        """Serve the database-backed apps from the lookup cache, so rendering a login link runs no query."""
+        if any("APP" in config or "APPS" in config for config in app_settings.PROVIDERS.values()):
+            # Apps configured in settings are blended in by allauth itself.
+            return super().list_apps(request, provider=provider, client_id=client_id)
+        site_id = get_current_site(request).pk if request and allauth_settings.SITES_ENABLED else None
+        apps = [
+            app
+            for app, site_ids in social_apps()
+            if (site_id is None or site_id in site_ids)
+            and (provider is None or provider in (app.provider, app.provider_id))
+            and (client_id is None or app.client_id == client_id)
+        ]
+        if apps:
+            # The OAuth flow needs the secrets, which are kept out of the shared cache.
+            secrets = social_app_secrets()
+            for app in apps:
+                app.secret = secrets.get(app.pk, "")
+        return apps
@@ -1,13 +1,30 @@
+from typing import Tuple
+
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db.models import Q
 from django.db.models import QuerySet
 from django.http import HttpRequest
 
 from .models import GitHubRepo
+from .models import GitHubRepoSummary
 from .models import UserGitHubRepo
+from .pagination import EstimatedCountPaginator
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables with millions of rows.
+
+    Counts come from Postgres statistics, the unfiltered total is never computed, and only
+    columns with an index behind them can be sorted on.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(GitHubRepo)
-class GitHubRepoAdmin(admin.ModelAdmin):
+class GitHubRepoAdmin(ScalableAdmin):
     list_display = (
         "id",
         "github_id",
@@ -18,18 +35,70 @@ class GitHubRepoAdmin(admin.ModelAdmin):
         "stargazers_count",
         "forks_count",
     )
-    search_fields = ("name", "full_name", "github_id", "language")
+    # full_name includes name, and UPPER(full_name) LIKE is served by the trigram index.
+    search_fields = ("full_name",)
+    search_help_text = "Substring of owner/name, or an exact GitHub id."
     ordering = ("-stargazers_count",)
+    sortable_by = ("id", "stargazers_count")
     readonly_fields = ("github_id",)
 
+    def get_search_results(
+        self, request: HttpRequest, queryset: QuerySet[GitHubRepo], search_term: str
+    ) -> Tuple[QuerySet[GitHubRepo], bool]:
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        query = Q(full_name__icontains=term)
+        if term.isdigit():
+            # The admin's "=github_id" would compare UPPER(github_id::text) and skip the unique index.
+            query |= Q(github_id=int(term))
+        return queryset.filter(query), False
+
 
 @admin.register(UserGitHubRepo)
-class UserGitHubRepoAdmin(admin.ModelAdmin):
+class UserGitHubRepoAdmin(ScalableAdmin):
     list_display = ("id", "user", "repo", "disabled")
     list_filter = ("disabled",)
-    search_fields = ("user__username", "repo__name", "repo__full_name")
+    search_fields = ("user__username", "repo__full_name")
+    search_help_text = "Username prefix, or a substring of the repo's owner/name (first 100 matches of each)."
+    search_match_limit = 100
+    sortable_by = ("id",)
     raw_id_fields = ("user", "repo")
 
     def get_queryset(self, request: HttpRequest) -> QuerySet[UserGitHubRepo]:
         qs = super().get_queryset(request)
         return qs.select_related("user", "repo")
+
+    def get_search_results(
+        self, request: HttpRequest, queryset: QuerySet[UserGitHubRepo], search_term: str
+    ) -> Tuple[QuerySet[UserGitHubRepo], bool]:
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        # Resolve users and repos through their own indexes first (the username varchar_pattern_ops index for
+        # the prefix, the trigram index for full_name). With literal ids the planner can estimate the links
+        # and combines the (user, repo) and repo FK indexes instead of scanning the link table.
+        user_ids = list(
+            get_user_model()
+            .objects.filter(username__startswith=term)
+            .order_by("username")
+            .values_list("pk", flat=True)[: self.search_match_limit]
+        )
+        repo_ids = list(
+            GitHubRepo.objects.filter(full_name__icontains=term)
+            .order_by("-stargazers_count", "-id")
+            .values_list("pk", flat=True)[: self.search_match_limit]
+        )
+        return queryset.filter(Q(user__in=user_ids) | Q(repo__in=repo_ids)), False
+
+
+@admin.register(GitHubRepoSummary)
+class GitHubRepoSummaryAdmin(ScalableAdmin):
+    list_display = ("id", "user", "repo_count", "total_stars", "total_forks", "repo_version", "computed_at")
+    sortable_by = ("id",)
+    raw_id_fields = ("user",)
+    # Maintained by sync_repos; edits would be overwritten by the next sync anyway.
+    readonly_fields = ("repo_count", "total_stars", "total_forks", "languages", "repo_version", "computed_at")
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet[GitHubRepoSummary]:
+        return super().get_queryset(request).select_related("user")
@@ -0,0 +1,79 @@
+"""Deletion of long-disabled links and of repos no link points to.
+
+Each batch is one short transaction over at most ``COMPACTION_BATCH_SIZE`` rows taken in primary key
+order after a cursor; rows locked by a running sync are skipped rather than waited for and are
+picked up by a later pass.
+"""
+
+from datetime import datetime
+from typing import Optional
+from typing import Tuple
+
+from django.db import IntegrityError
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GitHubRepo
+from .models import GitHubSyncState
+from .models import UserGitHubRepo
+
+
+def compact_links_batch(after_id: int, cutoff: datetime, size: int) -> Tuple[Optional[int], int]:
+    """Delete the links, among the next ``size`` disabled ones, that were disabled before ``cutoff``.
+
+    Links disabled before ``disabled_at`` existed get it stamped now, which starts their retention
+    window. Returns the last primary key looked at (``None`` past the end) and the number of deleted links.
+    """
+    with transaction.atomic():
+        rows = list(
+            UserGitHubRepo.objects.filter(disabled=True, pk__gt=after_id)
+            .order_by("pk")
+            .select_for_update(skip_locked=True)
+            .values_list("pk", "user_id", "disabled_at")[:size]
+        )
+        if not rows:
+            return None, 0
+        expired = [(pk, user_id) for pk, user_id, disabled_at in rows if disabled_at and disabled_at < cutoff]
+        unstamped = [pk for pk, _, disabled_at in rows if disabled_at is None]
+        if unstamped:
+            UserGitHubRepo.objects.filter(pk__in=unstamped).update(disabled_at=timezone.now())
+        if expired:
+            UserGitHubRepo.objects.filter(pk__in=[pk for pk, _ in expired]).delete()
+            # The listing shows disabled links too, so their owners' cached pages are out of date.
+            GitHubSyncState.bump({user_id for _, user_id in expired})
+    return rows[-1][0], len(expired)
+
+
+def compact_repos_batch(after_id: int, cutoff: datetime, size: int) -> Tuple[Optional[int], int]:
+    """Delete the repos, among the next ``size``, that no link points to and no sync wrote since ``cutoff``.
+
+    Syncs read the repos they are about to link ``FOR KEY SHARE``, so those rows are skipped here. A link
+    committed between this statement's snapshot and its commit fails the foreign key check instead; the
+    batch is then rolled back and its repos are left for the next pass.
+    Returns the last primary key looked at (``None`` past the end) and the number of deleted repos.
+    """
+    repos = GitHubRepo._meta.db_table
+    links = UserGitHubRepo._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT id FROM {repos} WHERE id > %s ORDER BY id LIMIT %s", [after_id, size])
+        ids = [pk for (pk,) in cursor.fetchall()]
+        if not ids:
+            return None, 0
+        try:
+            with transaction.atomic():
+                cursor.execute(
+                    f"""
+                    DELETE FROM {repos} WHERE id IN (
+                        SELECT r.id FROM {repos} r
+                        WHERE r.id = ANY(%s) AND (r.refreshed_at IS NULL OR r.refreshed_at < %s)
+                        AND NOT EXISTS (SELECT 1 FROM {links} l WHERE l.repo_id = r.id)
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    """,
+                    [ids, cutoff],
+                )
+                deleted = cursor.rowcount
+        except IntegrityError:
+            deleted = 0
+    return ids[-1], deleted
@@ -0,0 +1,225 @@
+import codecs
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from http import HTTPStatus
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from requests.adapters import HTTPAdapter
+
+from .metrics import SYNC_PHASE_DURATION
+from .throttling import GitHubTransientError
+from .throttling import acquire
+from .throttling import observe
+from .throttling import record_failure
+
+PER_PAGE = 100
+STREAM_CHUNK_BYTES = 64 * 1024
+
+Validators = Tuple[str, str]
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide keep-alive session.
+
+    Created lazily so every Celery child process gets its own connection pool after fork.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=settings.GITHUB_FETCH_WORKERS, pool_block=True)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update(
+                    {
+                        "Accept": "application/vnd.github.v3+json",
+                        "User-Agent": "Django-Allauth-App",
+                    }
+                )
+                _session = session
+    return _session
+
+
+def last_page_number(response: requests.Response) -> int:
+    last = response.links.get("last")
+    if not last:
+        return 1
+    pages = parse_qs(urlparse(last["url"]).query).get("page")
+    return int(pages[0]) if pages else 1
+
+
+@dataclass
+class RepoPage:
+    number: int
+    not_modified: bool
+    repos: Optional[List[Dict[str, Any]]]
+    etag: str
+    last_modified: str
+
+
+def get_repos_page(
+    token: str,
+    page: int,
+    validators: Optional[Validators] = None,
+    stream: bool = False,
+    sort: str = "created",
+    direction: Optional[str] = None,
+) -> requests.Response:
+    params = {"per_page": PER_PAGE, "page": page, "sort": sort}
+    if direction:
+        params["direction"] = direction
+    headers = {"Authorization": f"Bearer {token}"}
+    if validators:
+        etag, last_modified = validators
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    acquire(token)
+    try:
+        with SYNC_PHASE_DURATION.labels("fetch_page").time():
+            response = get_session().get(
+                f"{settings.GITHUB_API_URL}/user/repos",
+                headers=headers,
+                params=params,
+                timeout=settings.GITHUB_TIMEOUT,
+                stream=stream,
+            )
+    except (requests.ConnectionError, requests.Timeout) as exc:
+        record_failure()
+        raise GitHubTransientError(str(exc)) from exc
+    observe(token, response)
+    response.raise_for_status()
+    return response
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Yield the elements of a JSON array while its bytes are still arriving."""
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A value ending exactly at the buffer end may be a truncated number.
+                if end < len(buffer) or eof:
+                    yield item
+                    pos = end
+                    continue
+        elif eof:
+            raise ValueError("Unexpected end of JSON array")
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            eof = True
+            chunk = b""
+        buffer = buffer[pos:] + text.decode(chunk, final=eof)
+        pos = 0
+
+
+def stream_repos(response: requests.Response) -> Iterator[Dict[str, Any]]:
+    try:
+        yield from iter_json_array(response.iter_content(chunk_size=STREAM_CHUNK_BYTES))
+    finally:
+        response.close()
+
+
+def to_repo_page(number: int, response: requests.Response, stream: bool = False) -> RepoPage:
+    not_modified = response.status_code == HTTPStatus.NOT_MODIFIED
+    if not_modified:
+        repos = None
+    elif stream:
+        repos = stream_repos(response)
+    else:
+        repos = response.json()
+    return RepoPage(
+        number=number,
+        not_modified=not_modified,
+        repos=repos,
+        etag=response.headers.get("ETag", ""),
+        last_modified=response.headers.get("Last-Modified", ""),
+    )
+
+
+def iter_user_repos(
+    token: str, cached: Optional[Dict[int, Validators]] = None, stream: bool = False
+) -> Iterator[RepoPage]:
+    """Fetch every page of ``/user/repos``, yielding pages in order.
+
+    The first page tells us the last page number through the ``Link`` header, even when it is a ``304``;
+    the remaining pages are fetched concurrently on a bounded thread pool.
+    Pages with ``cached`` validators are requested conditionally; a ``304``
+    page is returned with ``not_modified`` set and its body is never decoded.
+    With ``stream`` the page ``repos`` is an iterator parsing the body as it is read.
+    """
+    cached = cached or {}
+    first = get_repos_page(token, 1, cached.get(1), stream)
+    if first.status_code == HTTPStatus.NOT_MODIFIED and "last" not in first.links:
+        # GitHub sends the Link header with a 304 as well, so pages added since the last sync are still
+        # fetched; without one, the cached pages are all that is known.
+        last = max(cached)
+    else:
+        last = last_page_number(first)
+    yield to_repo_page(1, first, stream)
+    if last > 1:
+        workers = min(settings.GITHUB_FETCH_WORKERS, last - 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            responses = pool.map(lambda page: get_repos_page(token, page, cached.get(page), stream), range(2, last + 1))
+            for number, response in enumerate(responses, start=2):
+                yield to_repo_page(number, response, stream)
+
+
+def iter_recently_updated_repos(token: str, since: Optional[datetime]) -> Iterator[RepoPage]:
+    """Fetch ``/user/repos`` newest ``updated_at`` first, one page at a time.
+
+    Stops after the first page that reaches a repo updated before ``since``, so a sync
+    after a quiet period costs a single request. Deleted repos are never seen this way.
+    """
+    page = 1
+    while True:
+        response = get_repos_page(token, page, sort="updated", direction="desc")
+        repo_page = to_repo_page(page, response)
+        yield repo_page
+        if "next" not in response.links or not repo_page.repos:
+            return
+        oldest = parse_datetime(repo_page.repos[-1].get("updated_at") or "")
+        if since is not None and oldest is not None and oldest < since:
+            return
+        page += 1
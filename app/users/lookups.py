@@ -0,0 +1,147 @@
+"""Cached reads of the allauth rows that every login page, repos page and sync needs.
+
+A lookup is answered by a small in-process LRU, then by the shared cache, and only then by the
+database. ``users.signals`` deletes the shared entries once changes to the rows behind them commit;
+the local copies of other processes may lag behind by up to ``LOOKUP_LOCAL_TIMEOUT`` seconds.
+
+Credentials never go to the shared cache: app secrets are only cached in-process, and GitHub
+tokens are read from the database by every sync.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import FrozenSet
+from typing import Hashable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from allauth.socialaccount.models import SocialAccount
+from allauth.socialaccount.models import SocialApp
+from allauth.socialaccount.models import SocialToken
+from django.conf import settings
+from django.core.cache import cache
+
+# Holds field dicts rather than the SocialApp instances cached under "allauth:social-apps" before.
+SOCIAL_APPS_KEY = "allauth:social-app-fields"
+SOCIAL_APP_SECRETS_KEY = "allauth:social-app-secrets"
+# Everything the adapter and the views read from an app, except its secret.
+SOCIAL_APP_FIELDS = ("id", "provider", "provider_id", "name", "client_id", "key", "settings")
+
+MISSING = object()
+
+
+def github_account_key(user_id: int) -> str:
+    return f"allauth:github-account:{user_id}"
+
+
+class LocalCache:
+    """A thread-safe LRU of at most ``max_entries`` values, each kept for a given number of seconds."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, timeout: float) -> None:
+        if timeout <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalCache(settings.LOOKUP_LOCAL_MAX_ENTRIES)
+
+
+def cached_lookup(key: str, load: Callable[[], Any]) -> Any:
+    """Return the cached value for ``key``, loading and caching it on a miss; ``None`` is cached too."""
+    value = local_cache.get(key)
+    if value is not MISSING:
+        return value
+    # Wrapped in a tuple so a cached None is told apart from a miss.
+    entry = cache.get(key)
+    if entry is None:
+        entry = (load(),)
+        cache.set(key, entry, settings.LOOKUP_CACHE_TIMEOUT)
+    local_cache.set(key, entry[0], settings.LOOKUP_LOCAL_TIMEOUT)
+    return entry[0]
+
+
+def local_lookup(key: str, load: Callable[[], Any]) -> Any:
+    """Like :func:`cached_lookup`, but the value is kept in this process only."""
+    value = local_cache.get(key)
+    if value is MISSING:
+        value = load()
+        local_cache.set(key, value, settings.LOOKUP_LOCAL_TIMEOUT)
+    return value
+
+
+def invalidate(*keys: str) -> None:
+    cache.delete_many(keys)
+    for key in keys:
+        local_cache.delete(key)
+
+
+def social_apps() -> List[Tuple[SocialApp, FrozenSet[int]]]:
+    """Every database-backed app with the ids of the sites it is enabled on, in primary key order.
+
+    The apps come without their secret; see :func:`social_app_secrets`.
+    """
+
+    def load() -> List[Tuple[Dict[str, Any], FrozenSet[int]]]:
+        site_ids = {}
+        for app_id, site_id in SocialApp.sites.through.objects.values_list("socialapp_id", "site_id"):
+            site_ids.setdefault(app_id, set()).add(site_id)
+        apps = SocialApp.objects.order_by("pk").values(*SOCIAL_APP_FIELDS)
+        return [(fields, frozenset(site_ids.get(fields["id"], ()))) for fields in apps]
+
+    # Fresh instances on every call, so callers never share one between threads.
+    return [(SocialApp(**fields), site_ids) for fields, site_ids in cached_lookup(SOCIAL_APPS_KEY, load)]
+
+
+def social_app_secrets() -> Dict[int, str]:
+    """The secret of every app by primary key, for the OAuth flow."""
+    return local_lookup(SOCIAL_APP_SECRETS_KEY, lambda: dict(SocialApp.objects.values_list("pk", "secret")))
+
+
+def github_app() -> Optional[SocialApp]:
+    return next((app for app, _ in social_apps() if app.provider == "github"), None)
+
+
+def github_account(user_id: int) -> Optional[SocialAccount]:
+    return cached_lookup(
+        github_account_key(user_id),
+        lambda: SocialAccount.objects.filter(user_id=user_id, provider="github").first(),
+    )
+
+
+def github_token(user_id: int) -> Optional[str]:
+    """The user's GitHub token; one indexed query, as tokens are not cached."""
+    tokens = SocialToken.objects.filter(account__user_id=user_id, account__provider="github")
+    return tokens.values_list("token", flat=True).first()
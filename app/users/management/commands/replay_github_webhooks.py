@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.test import RequestFactory
+from django.urls import reverse
+from users.tasks import apply_webhook_events
+from users.views import github_webhook
+from users.webhooks import sign_payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay recorded GitHub webhook deliveries (JSON lines of event, delivery and payload), "
+        "signed with GITHUB_WEBHOOK_SECRET, against a running server or the webhook view in-process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument("--url", help="POST to this webhook URL instead of calling the view in-process")
+        parser.add_argument("--apply", action="store_true", help="apply the queued events before returning")
+
+    def handle(self, *args, **options):
+        secret = settings.GITHUB_WEBHOOK_SECRET
+        if not secret:
+            raise CommandError("GITHUB_WEBHOOK_SECRET is not set.")
+        try:
+            lines = options["path"].read_text().splitlines()
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        factory = RequestFactory()
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            delivery = json.loads(line)
+            body = json.dumps(delivery["payload"]).encode()
+            headers = {
+                "X-GitHub-Event": delivery["event"],
+                "X-GitHub-Delivery": delivery["delivery"],
+                "X-Hub-Signature-256": sign_payload(secret, body),
+            }
+            if options["url"]:
+                status = requests.post(
+                    options["url"],
+                    data=body,
+                    headers={**headers, "Content-Type": "application/json"},
+                    timeout=settings.GITHUB_TIMEOUT,
+                ).status_code
+            else:
+                request = factory.post(
+                    reverse("github_webhook"), data=body, content_type="application/json", headers=headers
+                )
+                status = github_webhook(request).status_code
+            self.stdout.write(f"{number}: {delivery['event']} {delivery['delivery']} -> {status}")
+
+        if options["apply"]:
+            while True:
+                result = apply_webhook_events()
+                if not result["events"]:
+                    break
+                self.stdout.write(f"applied {result}")
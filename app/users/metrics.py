@@ -0,0 +1,139 @@
+"""Prometheus collectors for the web views and the sync tasks.
+
+With ``PROMETHEUS_MULTIPROC_DIR`` set, every gunicorn and Celery process writes its
+samples to memory-mapped files in that directory and a scrape aggregates them;
+otherwise the samples live in this process only.
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+from amqp.exceptions import ChannelError
+from celery import current_app
+from django.conf import settings
+from django.db import connection
+from prometheus_client import REGISTRY
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import generate_latest
+from prometheus_client import multiprocess
+from prometheus_client import start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, by URL name and response status.",
+    ["view", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries run while handling a request.",
+    ["view"],
+    buckets=QUERY_BUCKETS,
+)
+SYNC_PHASE_DURATION = Histogram(
+    "github_sync_phase_duration_seconds",
+    "Time spent in each sync_repos phase: token lookup, one page fetch, one chunk write, final diff.",
+    ["phase"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+SYNC_QUERIES = Histogram(
+    "github_sync_db_queries",
+    "Database queries run by one sync_repos task.",
+    buckets=QUERY_BUCKETS,
+)
+SYNC_RUNS = Counter(
+    "github_sync_runs",
+    "Finished sync_repos runs by result.",
+    ["result"],
+)
+SYNC_REPOS = Counter(
+    "github_sync_repos",
+    "Repos created, updated, linked and links disabled by sync_repos.",
+    ["outcome"],
+)
+
+COMPACTION_ROWS = Counter(
+    "github_compaction_deleted_rows",
+    "Expired disabled links and orphaned repos deleted by compaction.",
+    ["table"],
+)
+
+
+class QueryCounter:
+    """Database execute wrapper that only counts queries, so it can stay on in production."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+class CeleryQueueCollector:
+    """Report the number of messages waiting in every Celery queue at scrape time."""
+
+    def family(self) -> GaugeMetricFamily:
+        return GaugeMetricFamily("celery_queue_length", "Messages waiting in a Celery queue.", labels=["queue"])
+
+    def describe(self):
+        # Registering a collector without describe() would collect it, and so reach the broker at import time.
+        yield self.family()
+
+    def collect(self):
+        depth = self.family()
+        try:
+            with current_app.connection_for_read() as conn:
+                for name in current_app.amqp.queues:
+                    try:
+                        count = conn.default_channel.queue_declare(queue=name, passive=True).message_count
+                    except ChannelError:
+                        # The broker only knows a queue once something was published to it.
+                        count = 0
+                    depth.add_metric([name], count)
+        except Exception:
+            logger.warning("metrics: could not read Celery queue lengths", exc_info=True)
+            return
+        yield depth
+
+
+queue_registry = CollectorRegistry()
+queue_registry.register(CeleryQueueCollector())
+
+
+def process_registry() -> CollectorRegistry:
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics() -> bytes:
+    return generate_latest(process_registry()) + generate_latest(queue_registry)
+
+
+def start_worker_metrics_server() -> None:
+    """Serve the metrics of every pool process from the Celery worker's main process."""
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=process_registry())
+
+
+def mark_process_dead(pid: int) -> None:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
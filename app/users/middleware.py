@@ -0,0 +1,25 @@
+import time
+
+from django.http import HttpRequest
+from django.http import HttpResponse
+
+from .metrics import REQUEST_LATENCY
+from .metrics import REQUEST_QUERIES
+from .metrics import count_queries
+
+
+class MetricsMiddleware:
+    """Record request latency and query count, labelled by URL name to keep label values bounded."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        started = time.perf_counter()
+        with count_queries() as queries:
+            response = self.get_response(request)
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        REQUEST_LATENCY.labels(view, str(response.status_code)).observe(time.perf_counter() - started)
+        REQUEST_QUERIES.labels(view).observe(queries.count)
+        return response
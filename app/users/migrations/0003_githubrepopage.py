@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_alter_githubrepo_unique_together_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GitHubRepoPage",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("number", models.PositiveIntegerField()),
+                ("etag", models.CharField(blank=True, default="", max_length=200)),
+                ("last_modified", models.CharField(blank=True, default="", max_length=100)),
+                ("github_ids", models.JSONField(default=list)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "unique_together": {("user", "number")},
+            },
+        ),
+    ]
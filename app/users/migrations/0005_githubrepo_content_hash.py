@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_githubsyncstate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="githubrepo",
+            name="content_hash",
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_githubrepo_content_hash"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="githubsyncstate",
+            name="synced_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="githubsyncstate",
+            index=models.Index(
+                models.OrderBy(models.F("synced_at"), nulls_first=True), name="users_syncstate_synced_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:56
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so existing link tables stay writable during the migration.
+    atomic = False
+
+    dependencies = [
+        ("users", "0006_githubsyncstate_synced_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="githubrepo",
+            index=models.Index(
+                models.OrderBy(models.F("stargazers_count"), descending=True),
+                models.OrderBy(models.F("id"), descending=True),
+                name="users_repo_stars_id_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="usergithubrepo",
+            index=models.Index(fields=["user", "repo"], include=("disabled",), name="users_link_user_repo_cov_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="usergithubrepo",
+            index=models.Index(
+                condition=models.Q(("disabled", False)), fields=["user", "repo"], name="users_link_user_active_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:07
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so the repo table stays writable during the migration.
+    atomic = False
+
+    dependencies = [
+        ("users", "0007_listing_indexes"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name="githubrepo",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("full_name"), name="gin_trgm_ops"
+                ),
+                name="users_repo_name_trgm_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="githubrepo",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("description"), name="gin_trgm_ops"
+                ),
+                name="users_repo_desc_trgm_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0008_repo_search_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="githubrepo",
+            name="pushed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="githubrepo",
+            name="updated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="githubsyncstate",
+            name="high_water_mark",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="githubsyncstate",
+            name="reconciled_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0009_incremental_sync"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="githubrepo",
+            name="refreshed_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
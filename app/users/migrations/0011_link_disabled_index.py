@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:20
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Built concurrently so the link table stays writable during the migration.
+    atomic = False
+
+    dependencies = [
+        ("users", "0010_githubrepo_refreshed_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="usergithubrepo",
+            index=models.Index(condition=models.Q(("disabled", True)), fields=["-id"], name="users_link_disabled_idx"),
+        ),
+    ]
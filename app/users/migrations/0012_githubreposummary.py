@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0011_link_disabled_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GitHubRepoSummary",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("repo_count", models.PositiveIntegerField(default=0)),
+                ("total_stars", models.PositiveBigIntegerField(default=0)),
+                ("total_forks", models.PositiveBigIntegerField(default=0)),
+                ("languages", models.JSONField(default=dict)),
+                ("repo_version", models.PositiveBigIntegerField(default=0)),
+                ("computed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="github_repo_summary",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
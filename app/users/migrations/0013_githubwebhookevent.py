@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0012_githubreposummary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GitHubWebhookEvent",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("delivery_id", models.CharField(max_length=100, unique=True)),
+                ("event", models.CharField(max_length=50)),
+                ("payload", models.JSONField()),
+                ("received_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
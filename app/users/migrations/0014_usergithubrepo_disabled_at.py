@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0013_githubwebhookevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usergithubrepo",
+            name="disabled_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:34
+
+from django.contrib.postgres.operations import RemoveIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # The unique (user, repo) index already has the key; dropped concurrently so the link table stays writable.
+    atomic = False
+
+    dependencies = [
+        ("users", "0014_usergithubrepo_disabled_at"),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name="usergithubrepo",
+            name="users_link_user_repo_cov_idx",
+        ),
+    ]
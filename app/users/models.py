@@ -1,5 +1,12 @@
+from typing import List
+from typing import Tuple
+
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 
 
 class GitHubRepo(models.Model):
@@ -12,9 +19,20 @@ class GitHubRepo(models.Model):
     forks_count = models.IntegerField(default=0)
     language = models.CharField(max_length=100, blank=True, null=True)
     private = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(blank=True, null=True)
+    pushed_at = models.DateTimeField(blank=True, null=True)
+    # Last time a sync wrote this row; for GITHUB_REPO_REFRESH_TTL seconds syncs skip metadata that is no newer.
+    refreshed_at = models.DateTimeField(blank=True, null=True, editable=False)
+    content_hash = models.CharField(max_length=40, blank=True, null=True, editable=False)
 
     class Meta:
         ordering = ["-stargazers_count"]
+        indexes = [
+            models.Index(models.F("stargazers_count").desc(), models.F("id").desc(), name="users_repo_stars_id_idx"),
+            # Trigram indexes on UPPER(...) serve the listing search, which filters with icontains.
+            GinIndex(OpClass(Upper("full_name"), name="gin_trgm_ops"), name="users_repo_name_trgm_idx"),
+            GinIndex(OpClass(Upper("description"), name="gin_trgm_ops"), name="users_repo_desc_trgm_idx"),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -24,6 +42,79 @@ class UserGitHubRepo(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     repo = models.ForeignKey(GitHubRepo, on_delete=models.CASCADE)
     disabled = models.BooleanField(default=False)
+    # When the link was last disabled; compaction deletes links disabled longer than COMPACTION_LINK_RETENTION.
+    disabled_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         unique_together = ("user", "repo")
+        indexes = [
+            models.Index(
+                fields=["user", "repo"], condition=models.Q(disabled=False), name="users_link_user_active_idx"
+            ),
+            # Backs the admin's "disabled" filter and the compaction scan, which would otherwise walk the
+            # primary key past every active link.
+            models.Index(fields=["-id"], condition=models.Q(disabled=True), name="users_link_disabled_idx"),
+        ]
+
+
+class GitHubRepoSummary(models.Model):
+    """Per-user totals over the active repo links, rewritten by the sync that changes them."""
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="github_repo_summary")
+    repo_count = models.PositiveIntegerField(default=0)
+    total_stars = models.PositiveBigIntegerField(default=0)
+    total_forks = models.PositiveBigIntegerField(default=0)
+    # {language: number of repos}; repos without a language are left out.
+    languages = models.JSONField(default=dict)
+    # GitHubSyncState.repo_version the totals were computed at; they are stale once the state moves past it.
+    repo_version = models.PositiveBigIntegerField(default=0)
+    computed_at = models.DateTimeField(blank=True, null=True)
+
+    def top_languages(self, limit: int = 5) -> List[Tuple[str, int]]:
+        return sorted(self.languages.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+class GitHubRepoPage(models.Model):
+    """Validators of the last fetched ``/user/repos`` page, used for conditional requests."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    number = models.PositiveIntegerField()
+    etag = models.CharField(max_length=200, blank=True, default="")
+    last_modified = models.CharField(max_length=100, blank=True, default="")
+    github_ids = models.JSONField(default=list)
+
+    class Meta:
+        unique_together = ("user", "number")
+
+
+class GitHubSyncState(models.Model):
+    """Per-user sync bookkeeping; ``repo_version`` changes whenever the user's repo listing does."""
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="github_sync_state")
+    repo_version = models.PositiveBigIntegerField(default=0)
+    repos_changed_at = models.DateTimeField(blank=True, null=True)
+    synced_at = models.DateTimeField(blank=True, null=True)
+    # Newest GitHub ``updated_at`` seen for the user; incremental syncs stop paginating below it.
+    high_water_mark = models.DateTimeField(blank=True, null=True)
+    reconciled_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(models.F("synced_at").asc(nulls_first=True), name="users_syncstate_synced_at_idx"),
+        ]
+
+    @classmethod
+    def bump(cls, user_ids) -> int:
+        return cls.objects.filter(user_id__in=user_ids).update(
+            repo_version=models.F("repo_version") + 1, repos_changed_at=timezone.now()
+        )
+
+
+class GitHubWebhookEvent(models.Model):
+    """A verified webhook delivery waiting for ``apply_webhook_events``; rows are deleted once applied."""
+
+    # X-GitHub-Delivery; GitHub redelivers with the same id, so duplicates are dropped on insert.
+    delivery_id = models.CharField(max_length=100, unique=True)
+    event = models.CharField(max_length=50)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(default=timezone.now)
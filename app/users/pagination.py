@@ -0,0 +1,163 @@
+import base64
+import json
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class KeysetPage:
+    def __init__(
+        self,
+        object_list: List[Dict[str, Any]],
+        number: int,
+        per_page: int,
+        has_previous: bool,
+        has_next: bool,
+        previous_cursor: Optional[str],
+        next_cursor: Optional[str],
+    ):
+        self.object_list = object_list
+        self.number = number
+        self.per_page = per_page
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def previous_page_number(self) -> int:
+        return self.number - 1
+
+    def next_page_number(self) -> int:
+        return self.number + 1
+
+
+class KeysetPaginator:
+    """Paginates a ``.values()`` queryset in the database.
+
+    ``ordering`` must be a unique key of the rows (e.g. ``("-stargazers_count", "-repo_id")``)
+    and every field of it has to be present in the selected values. Pages are addressed either
+    by an ``after``/``before`` cursor, which seeks on the ordering key and costs the same on
+    any page, or by a page number, which falls back to ``OFFSET``.
+    """
+
+    def __init__(self, queryset: QuerySet, ordering: Sequence[str], per_page: int):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+
+    def _fields(self) -> List[str]:
+        return [field.lstrip("-") for field in self.ordering]
+
+    def _cursor(self, row: Dict[str, Any]) -> str:
+        return encode_cursor([row[field] for field in self._fields()])
+
+    def _seek(self, values: Sequence[Any], forward: bool) -> Q:
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") == forward else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def _reversed_ordering(self) -> List[str]:
+        return [field[1:] if field.startswith("-") else f"-{field}" for field in self.ordering]
+
+    def page(self, number: int, after: Optional[str] = None, before: Optional[str] = None) -> KeysetPage:
+        size = len(self.ordering)
+        if before is not None:
+            values = decode_cursor(before, size)
+            qs = self.queryset.filter(self._seek(values, forward=False)).order_by(*self._reversed_ordering())
+            rows = list(qs[: self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[: self.per_page][::-1]
+            has_next = True
+        else:
+            qs = self.queryset.order_by(*self.ordering)
+            if after is not None:
+                qs = qs.filter(self._seek(decode_cursor(after, size), forward=True))
+                rows = list(qs[: self.per_page + 1])
+                has_previous = True
+            else:
+                offset = (number - 1) * self.per_page
+                rows = list(qs[offset : offset + self.per_page + 1])
+                has_previous = number > 1
+            has_next = len(rows) > self.per_page
+            rows = rows[: self.per_page]
+
+        if not rows and (number > 1 or after is not None or before is not None):
+            raise ValueError("Empty page")
+        return KeysetPage(
+            object_list=rows,
+            number=number,
+            per_page=self.per_page,
+            has_previous=has_previous and bool(rows),
+            has_next=has_next and bool(rows),
+            previous_cursor=self._cursor(rows[0]) if rows else None,
+            next_cursor=self._cursor(rows[-1]) if rows else None,
+        )
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that takes its count from Postgres statistics instead of running ``COUNT(*)``.
+
+    Unfiltered querysets use ``pg_class.reltuples``, filtered ones the planner's row estimate.
+    Below ``exact_threshold`` estimated rows an exact count is cheap and is used instead.
+    """
+
+    exact_threshold = 10_000
+
+    @cached_property
+    def count(self) -> int:
+        estimate = self.estimated_count()
+        if estimate is None or estimate < self.exact_threshold:
+            return self.object_list.count()
+        return estimate
+
+    def estimated_count(self) -> Optional[int]:
+        queryset = self.object_list
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 until the table has been vacuumed or analyzed.
+            return row[0] if row and row[0] >= 0 else None
+        plan = json.loads(queryset.order_by().explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,32 @@
+from functools import partial
+
+from allauth.socialaccount.models import SocialAccount
+from allauth.socialaccount.models import SocialApp
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .lookups import SOCIAL_APP_SECRETS_KEY
+from .lookups import SOCIAL_APPS_KEY
+from .lookups import github_account_key
+from .lookups import invalidate
+
+
+def invalidate_on_commit(*keys: str) -> None:
+    # Invalidated before the commit, another process could cache the old rows again in between.
+    transaction.on_commit(partial(invalidate, *keys))
+
+
+@receiver(post_save, sender=SocialApp)
+@receiver(post_delete, sender=SocialApp)
+@receiver(m2m_changed, sender=SocialApp.sites.through)
+def invalidate_social_apps(**kwargs):
+    invalidate_on_commit(SOCIAL_APPS_KEY, SOCIAL_APP_SECRETS_KEY)
+
+
+@receiver(post_save, sender=SocialAccount)
+@receiver(post_delete, sender=SocialAccount)
+def invalidate_social_account(instance, **kwargs):
+    invalidate_on_commit(github_account_key(instance.user_id))
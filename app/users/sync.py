@@ -0,0 +1,258 @@
+import hashlib
+import json
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import GitHubRepo
+from .models import GitHubRepoSummary
+from .models import GitHubSyncState
+from .models import UserGitHubRepo
+
+REPO_FIELDS = (
+    "name",
+    "full_name",
+    "html_url",
+    "description",
+    "stargazers_count",
+    "forks_count",
+    "language",
+    "private",
+    "updated_at",
+    "pushed_at",
+)
+
+REPO_COLUMN_TYPES = {
+    "github_id": "bigint",
+    "name": "varchar",
+    "full_name": "varchar",
+    "html_url": "varchar",
+    "description": "text",
+    "stargazers_count": "integer",
+    "forks_count": "integer",
+    "language": "varchar",
+    "private": "boolean",
+    "updated_at": "timestamptz",
+    "pushed_at": "timestamptz",
+    "content_hash": "varchar",
+}
+
+
+def repo_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "name": data.get("name") or "",
+        "full_name": data.get("full_name") or "",
+        "html_url": data.get("html_url") or "",
+        "description": data.get("description"),
+        "stargazers_count": data.get("stargazers_count") or 0,
+        "forks_count": data.get("forks_count") or 0,
+        "language": data.get("language"),
+        "private": data.get("private", False),
+        # Kept as GitHub's ISO 8601 strings so the content hash stays plain JSON; Postgres casts them.
+        "updated_at": data.get("updated_at"),
+        "pushed_at": data.get("pushed_at"),
+    }
+
+
+def content_hash(fields: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps([fields[name] for name in REPO_FIELDS]).encode()).hexdigest()
+
+
+def newest_update(api_repos: Iterable[Dict[str, Any]], since: Optional[datetime] = None) -> Optional[datetime]:
+    """The latest of ``since`` and the ``updated_at`` of the API payloads."""
+    timestamps = [parse_datetime(data["updated_at"]) for data in api_repos if data.get("updated_at")]
+    if since is not None:
+        timestamps.append(since)
+    return max(timestamps, default=None)
+
+
+def settled_github_ids(payloads: Dict[int, Tuple[str, Optional[str]]], refresh_ttl: Optional[int] = None) -> Set[int]:
+    """GitHub ids, out of ``{github_id: (content_hash, updated_at)}``, whose stored row needs no write.
+
+    A row is settled when its content already matches, or when any sync refreshed it within
+    ``refresh_ttl`` seconds (``GITHUB_REPO_REFRESH_TTL`` by default, 0 disables) and the payload is
+    no newer than the row: a user's own changes are never dropped because another sync came first.
+
+    The rows are read ``FOR KEY SHARE``: that lock does not conflict with other syncs reading or
+    updating popular shared repos, but it keeps compaction from deleting a repo that this
+    transaction is about to link.
+    """
+    sql = f"""
+        SELECT github_id, content_hash, updated_at,
+               %(ttl)s > 0 AND refreshed_at > now() - %(ttl)s * interval '1 second'
+        FROM {GitHubRepo._meta.db_table} WHERE github_id = ANY(%(ids)s)
+        FOR KEY SHARE
+    """
+    if refresh_ttl is None:
+        refresh_ttl = settings.GITHUB_REPO_REFRESH_TTL
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"ttl": refresh_ttl, "ids": list(payloads)})
+        rows = cursor.fetchall()
+    settled = set()
+    for github_id, stored_hash, stored_updated_at, fresh in rows:
+        digest, updated_at = payloads[github_id]
+        if stored_hash == digest:
+            settled.add(github_id)
+        elif fresh and stored_updated_at is not None and updated_at is not None:
+            if stored_updated_at >= parse_datetime(updated_at):
+                settled.add(github_id)
+    return settled
+
+
+def upsert_repos(api_repos: Iterable[Dict[str, Any]], refresh_ttl: Optional[int] = None) -> Tuple[int, List[int]]:
+    """Insert or update repos from API payloads.
+
+    Settled rows (see :func:`settled_github_ids`) are skipped; the rest are written in one statement,
+    which stamps ``refreshed_at``. Returns the number of created repos and the primary keys of updated ones.
+    """
+    payloads = {}
+    for data in api_repos:
+        fields = repo_fields(data)
+        payloads[data["id"]] = (fields, content_hash(fields))
+    if not payloads:
+        return 0, []
+    settled = settled_github_ids(
+        {github_id: (digest, fields["updated_at"]) for github_id, (fields, digest) in payloads.items()}, refresh_ttl
+    )
+
+    columns = {name: [] for name in REPO_COLUMN_TYPES}
+    for github_id, (fields, digest) in payloads.items():
+        if github_id in settled:
+            continue
+        columns["github_id"].append(github_id)
+        for name in REPO_FIELDS:
+            columns[name].append(fields[name])
+        columns["content_hash"].append(digest)
+    if not columns["github_id"]:
+        return 0, []
+
+    table = GitHubRepo._meta.db_table
+    names = ", ".join(REPO_COLUMN_TYPES)
+    arrays = ", ".join(f"%s::{column_type}[]" for column_type in REPO_COLUMN_TYPES.values())
+    updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in (*REPO_FIELDS, "content_hash", "refreshed_at"))
+    sql = f"""
+        INSERT INTO {table} ({names}, refreshed_at)
+        SELECT *, now() FROM unnest({arrays})
+        ON CONFLICT (github_id) DO UPDATE SET {updates}
+        WHERE {table}.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+        RETURNING id, (xmax = 0) AS created
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, list(columns.values()))
+        rows = cursor.fetchall()
+    created = sum(1 for _, is_created in rows if is_created)
+    return created, [pk for pk, is_created in rows if not is_created]
+
+
+def upsert_links(user_id: int, github_ids: List[int]) -> int:
+    """Link the user to the given repos, re-enabling disabled links.
+
+    Returns the number of links that were created or re-enabled.
+    """
+    if not github_ids:
+        return 0
+    sql = f"""
+        INSERT INTO {UserGitHubRepo._meta.db_table} (user_id, repo_id, disabled)
+        SELECT %s, id, false FROM {GitHubRepo._meta.db_table} WHERE github_id = ANY(%s)
+        ON CONFLICT (user_id, repo_id) DO UPDATE SET disabled = false, disabled_at = NULL
+        WHERE {UserGitHubRepo._meta.db_table}.disabled
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, github_ids])
+        return cursor.rowcount
+
+
+def refresh_summaries(user_ids: List[int]) -> int:
+    """Recompute the repo summaries of the given users from their active links.
+
+    The totals are rebuilt rather than adjusted by the created/updated/disabled counts: those counts
+    say nothing about how the stars, forks or language of an updated repo changed, a shared repo is
+    also updated by other users' syncs, and two syncs applying deltas to the same repo would both
+    count the change. Each user costs one scan of their own active links through
+    ``users_link_user_active_idx``, never an aggregate over the whole link table.
+    """
+    if not user_ids:
+        return 0
+    sql = f"""
+        INSERT INTO {GitHubRepoSummary._meta.db_table}
+            (user_id, repo_count, total_stars, total_forks, languages, repo_version, computed_at)
+        SELECT u.id, COALESCE(sum(g.repos), 0), COALESCE(sum(g.stars), 0), COALESCE(sum(g.forks), 0),
+               COALESCE(jsonb_object_agg(g.language, g.repos) FILTER (WHERE g.language IS NOT NULL), '{{}}'),
+               COALESCE(max(s.repo_version), 0), now()
+        FROM unnest(%s::bigint[]) AS u(id)
+        LEFT JOIN {GitHubSyncState._meta.db_table} s ON s.user_id = u.id
+        LEFT JOIN LATERAL (
+            SELECT r.language, count(*) AS repos, sum(r.stargazers_count) AS stars, sum(r.forks_count) AS forks
+            FROM {UserGitHubRepo._meta.db_table} l
+            JOIN {GitHubRepo._meta.db_table} r ON r.id = l.repo_id
+            WHERE l.user_id = u.id AND NOT l.disabled
+            GROUP BY r.language
+        ) g ON true
+        GROUP BY u.id
+        ON CONFLICT (user_id) DO UPDATE SET
+            repo_count = EXCLUDED.repo_count, total_stars = EXCLUDED.total_stars,
+            total_forks = EXCLUDED.total_forks, languages = EXCLUDED.languages,
+            repo_version = EXCLUDED.repo_version, computed_at = EXCLUDED.computed_at
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(user_ids)])
+        return cursor.rowcount
+
+
+def refresh_stale_summaries(user_ids: Iterable[int]) -> List[int]:
+    """Refresh the summaries of the given users that are missing or behind their ``repo_version``.
+
+    Returns the ids of the refreshed users.
+    """
+    user_ids = set(user_ids)
+    states = dict(GitHubSyncState.objects.filter(user_id__in=user_ids).values_list("user_id", "repo_version"))
+    summaries = dict(GitHubRepoSummary.objects.filter(user_id__in=user_ids).values_list("user_id", "repo_version"))
+    stale = sorted(
+        user_id for user_id in user_ids if summaries.get(user_id) is None or summaries[user_id] < states.get(user_id, 0)
+    )
+    refresh_summaries(stale)
+    return stale
+
+
+def batched(iterable: Iterable[Any], size: Optional[int]) -> Iterator[List[Any]]:
+    """Split ``iterable`` into lists of ``size`` items; ``None`` means a single list."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_repos(user_id: int, api_repos: List[Dict[str, Any]], stale_summaries: Set[int]) -> Counter:
+    """Upsert a chunk of repos and the user's links to them in one transaction.
+
+    Every user whose ``repo_version`` is bumped is added to ``stale_summaries``; the sync refreshes
+    their summaries once, after its last chunk and outside the write transactions.
+    """
+    with transaction.atomic():
+        created, updated_ids = upsert_repos(api_repos)
+        linked = upsert_links(user_id, [repo["id"] for repo in api_repos])
+        bumped = set()
+        if created or updated_ids or linked:
+            bumped.add(user_id)
+        if updated_ids:
+            # Repos are shared, so every user linked to an updated repo sees a new listing.
+            bumped.update(UserGitHubRepo.objects.filter(repo_id__in=updated_ids).values_list("user_id", flat=True))
+        if bumped:
+            GitHubSyncState.bump(bumped)
+    stale_summaries.update(bumped)
+    return Counter(created=created, updated=len(updated_ids), linked=linked)
@@ -1,97 +1,420 @@
 import logging
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+from typing import Optional
+from typing import Set
+from typing import Tuple
 
-import requests
-from allauth.socialaccount.models import SocialAccount
-from allauth.socialaccount.models import SocialToken
+from celery import group
 from celery import shared_task
+from celery.exceptions import Ignore
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db import transaction
-from users.models import GitHubRepo
+from django.db.models import F
+from django.db.models import Q
+from django.utils import timezone
+from users.compaction import compact_links_batch
+from users.compaction import compact_repos_batch
+from users.github import iter_recently_updated_repos
+from users.github import iter_user_repos
+from users.lookups import github_token
+from users.metrics import COMPACTION_ROWS
+from users.metrics import SYNC_PHASE_DURATION
+from users.metrics import SYNC_QUERIES
+from users.metrics import SYNC_REPOS
+from users.metrics import SYNC_RUNS
+from users.metrics import count_queries
+from users.models import GitHubRepoPage
+from users.models import GitHubSyncState
+from users.models import GitHubWebhookEvent
 from users.models import UserGitHubRepo
+from users.sync import batched
+from users.sync import newest_update
+from users.sync import refresh_stale_summaries
+from users.sync import write_repos
+from users.throttling import GitHubThrottled
+from users.throttling import GitHubTransientError
+from users.throttling import backoff_delay
+from users.throttling import throttled_delay
+from users.webhooks import apply_events
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
 
-@shared_task(max_retries=3)
-def sync_repos(user_id: int):
+def sync_queued_key(user_id: int) -> str:
+    return f"sync-queued:{user_id}"
 
+
+def sync_running_key(user_id: int) -> str:
+    return f"sync-running:{user_id}"
+
+
+# Marks the task ids of scheduled syncs, so a user's trigger can tell that the queued one sits in the bulk lane.
+SCHEDULED_SYNC_PREFIX = "scheduled-"
+
+
+def claim_sync(user_id: int, scheduled: bool = False) -> Tuple[str, bool]:
+    """Reserve the queued sync slot of a user.
+
+    Returns the id of the task holding the slot and whether it was claimed just now;
+    when it was not, a sync for the user is already waiting and the caller should fold into it.
+    """
+    task_id = str(uuid.uuid4())
+    if scheduled:
+        task_id = SCHEDULED_SYNC_PREFIX + task_id
+    key = sync_queued_key(user_id)
+    for _ in range(2):
+        if cache.add(key, task_id, settings.SYNC_QUEUED_TIMEOUT):
+            return task_id, True
+        queued_id = cache.get(key)
+        if queued_id:
+            return queued_id, False
+    return task_id, True
+
+
+def enqueue_sync(user_id: int) -> Tuple[str, bool]:
+    """Queue ``sync_repos`` on the interactive lane for a user unless one is already waiting to start."""
+    task_id, claimed = claim_sync(user_id)
+    if not claimed and task_id.startswith(SCHEDULED_SYNC_PREFIX):
+        # The waiting sync is behind the scheduler's whole backlog, so the user's one takes over the slot and
+        # further triggers fold into it. The scheduled sync still runs later, finding little left to do.
+        task_id, claimed = str(uuid.uuid4()), True
+        cache.set(sync_queued_key(user_id), task_id, settings.SYNC_QUEUED_TIMEOUT)
+    if claimed:
+        sync_repos.apply_async((user_id,), task_id=task_id, queue=settings.SYNC_INTERACTIVE_QUEUE)
+    return task_id, claimed
+
+
+WEBHOOK_APPLY_QUEUED_KEY = "webhook-apply-queued"
+
+
+def enqueue_webhook_apply() -> bool:
+    """Schedule ``apply_webhook_events`` unless a run is already waiting, so deliveries are batched."""
+    delay = settings.GITHUB_WEBHOOK_BATCH_DELAY
+    if not cache.add(WEBHOOK_APPLY_QUEUED_KEY, True, settings.GITHUB_WEBHOOK_QUEUED_TIMEOUT):
+        return False
+    apply_webhook_events.apply_async(countdown=delay)
+    return True
+
+
+@shared_task(ignore_result=True)
+def apply_webhook_events():
+    """Apply up to ``GITHUB_WEBHOOK_BATCH_SIZE`` queued webhook events in one transaction.
+
+    Rows are claimed with ``SKIP LOCKED``, so overlapping runs split the queue instead of
+    waiting on each other; a full batch schedules the next run right away.
+    """
+    cache.delete(WEBHOOK_APPLY_QUEUED_KEY)
+    with transaction.atomic():
+        events = list(
+            GitHubWebhookEvent.objects.order_by("id").select_for_update(skip_locked=True)[
+                : settings.GITHUB_WEBHOOK_BATCH_SIZE
+            ]
+        )
+        if not events:
+            return {"events": 0}
+        counts = apply_events(events)
+        GitHubWebhookEvent.objects.filter(pk__in=[event.pk for event in events]).delete()
+    for outcome in ("created", "updated", "linked", "disabled"):
+        SYNC_REPOS.labels(outcome).inc(counts[outcome])
+    logger.info("apply_webhook_events: %s events, %s", len(events), dict(counts))
+    if len(events) == settings.GITHUB_WEBHOOK_BATCH_SIZE:
+        apply_webhook_events.delay()
+    return {"events": len(events), **counts}
+
+
+# Nothing reads the result back (the scheduler's callbacks get it directly), so it is not stored. A sync is
+# safe to run twice, so it is acknowledged only once it finishes and a worker crash redelivers it instead of losing it.
+@shared_task(bind=True, max_retries=3, ignore_result=True, acks_late=True)
+def sync_repos(self, user_id: int):
+    """Sync a user's repos; at most one runs per user and later triggers fold into one follow-up."""
+    task_id = self.request.id or ""
+    running_key = sync_running_key(user_id)
+    if not cache.add(running_key, task_id, settings.SYNC_LOCK_TIMEOUT):
+        # Keep our queued slot while we wait, so further triggers keep folding into this follow-up. The task is
+        # sent again as is rather than retried: waiting must not use up the retries GitHub errors back off with.
+        self.signature_from_request(countdown=settings.SYNC_LOCK_RETRY_DELAY).apply_async()
+        raise Ignore()
+    queued_key = sync_queued_key(user_id)
+    if cache.get(queued_key) == task_id:
+        cache.delete(queued_key)
+    try:
+        with count_queries() as queries:
+            return run_sync(self, user_id)
+    finally:
+        SYNC_QUERIES.observe(queries.count)
+        cache.delete(running_key)
+
+
+def run_sync(task, user_id: int) -> dict:
     try:
         user = User.objects.get(pk=user_id)
     except User.DoesNotExist:
         logger.warning("sync_repos: user id %s does not exist", user_id)
+        SYNC_RUNS.labels("user_not_found").inc()
         return {"ok": False, "reason": "user_not_found"}
-    account = SocialAccount.objects.get(user=user, provider="github")
-    token_obj = SocialToken.objects.filter(account=account).first()
-    token = token_obj.token
+    GitHubSyncState.objects.get_or_create(user=user)
+    GitHubSyncState.objects.filter(user=user).update(synced_at=timezone.now())
+    with SYNC_PHASE_DURATION.labels("token").time():
+        token = github_token(user_id)
     if not token:
         logger.warning("sync_repos: user id %s has no github token", user_id)
+        SYNC_RUNS.labels("no_github_token").inc()
         return {"ok": False, "reason": "no_github_token"}
 
-    api_repos = []
-    params = {"per_page": 100, "page": 1, "sort": "created"}
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/vnd.github.v3+json",
-        "User-Agent": "Django-Allauth-App",
-    }
-    r = requests.get("https://api.github.com/user/repos", headers=headers, params=params)
-    page_data = r.json()
-    api_repos.extend(page_data)
-
-    api_map = {repo["id"]: repo for repo in api_repos}
-    api_ids = set(api_map.keys())
-    existing_repos = GitHubRepo.objects.filter(github_id__in=api_ids)
-    existing_map = {r.github_id: r for r in existing_repos}
+    try:
+        result = sync_user_repos(user, token)
+    except GitHubThrottled as exc:
+        SYNC_RUNS.labels("throttled").inc()
+        logger.warning("sync_repos: user id %s delayed for %.0fs: %s", user_id, exc.retry_after, exc)
+        cache.add(sync_queued_key(user_id), task.request.id, settings.SYNC_QUEUED_TIMEOUT)
+        raise task.retry(
+            exc=exc,
+            countdown=throttled_delay(exc.retry_after),
+            max_retries=settings.GITHUB_THROTTLED_MAX_RETRIES,
+        )
+    except GitHubTransientError as exc:
+        SYNC_RUNS.labels("transient_error").inc()
+        logger.warning("sync_repos: user id %s transient GitHub error: %s", user_id, exc)
+        cache.add(sync_queued_key(user_id), task.request.id, settings.SYNC_QUEUED_TIMEOUT)
+        raise task.retry(exc=exc, countdown=backoff_delay(task.request.retries))
+    SYNC_RUNS.labels("not_modified" if result.get("not_modified") else "synced").inc()
+    for outcome in ("created", "updated", "linked", "disabled"):
+        SYNC_REPOS.labels(outcome).inc(result.get(outcome, 0))
+    return result
+
+
+def sync_user_repos(user, token: str) -> dict:
+    state = GitHubSyncState.objects.get(user=user)
+    # Syncs of other users may have updated shared repos, leaving this user's summary behind too.
+    stale_summaries = {user.pk}
+    if needs_reconcile(state):
+        result = reconcile_user_repos(user, token, state, stale_summaries)
+    else:
+        result = sync_recent_repos(user, token, state, stale_summaries)
+    # Once per sync rather than per chunk: the chunks only bump repo_version, of this user and of everyone
+    # linked to a shared repo they updated, leaving the summaries behind it.
+    refresh_stale_summaries(stale_summaries)
+    return result
+
+
+def needs_reconcile(state: GitHubSyncState) -> bool:
+    """Whether the next sync must walk the whole listing, which is the only way to notice deletions."""
+    if state.high_water_mark is None or state.reconciled_at is None:
+        return True
+    return state.reconciled_at < timezone.now() - timedelta(seconds=settings.GITHUB_RECONCILE_INTERVAL)
+
+
+def sync_recent_repos(user, token: str, state: GitHubSyncState, stale_summaries: Set[int]) -> dict:
+    """Write the repos updated since the last sync, reading pages newest first until older repos show up."""
+    counts = Counter(created=0, updated=0, linked=0)
+    newest = state.high_water_mark
+    for page in iter_recently_updated_repos(token, state.high_water_mark):
+        if not page.repos:
+            continue
+        with SYNC_PHASE_DURATION.labels("write").time():
+            counts.update(write_repos(user.pk, page.repos, stale_summaries))
+        newest = newest_update(page.repos, newest)
+    GitHubSyncState.objects.filter(user=user).update(high_water_mark=newest)
+    if not any(counts.values()):
+        logger.info("sync_repos: user id %s repos not modified since %s", user.pk, state.high_water_mark)
+        return {"ok": True, "not_modified": True}
+    return {"ok": True, **counts, "disabled": 0}
+
+
+def reconcile_user_repos(user, token: str, state: GitHubSyncState, stale_summaries: Set[int]) -> dict:
+    """Walk every page of the listing, revalidating cached pages, and disable links to repos that are gone."""
+    streaming = settings.GITHUB_SYNC_STREAMING
+    cached_pages = {page.number: page for page in GitHubRepoPage.objects.filter(user=user)}
+    validators = {number: (page.etag, page.last_modified) for number, page in cached_pages.items()}
+
     kept_ids = set()
-    to_create_repos = []
-    to_update_repos = []
-    to_create_user_links = []
-    for github_id, data in api_map.items():
-        kept_ids.add(github_id)
-        repo_fields = {
-            "name": data.get("name") or "",
-            "full_name": data.get("full_name") or "",
-            "html_url": data.get("html_url") or "",
-            "description": data.get("description"),
-            "stargazers_count": data.get("stargazers_count") or 0,
-            "forks_count": data.get("forks_count") or 0,
-            "language": data.get("language"),
-            "private": data.get("private", False),
-        }
-
-        if github_id in existing_map:
-            obj = existing_map[github_id]
-            changed = False
-            for k, v in repo_fields.items():
-                if getattr(obj, k) != v:
-                    setattr(obj, k, v)
-                    changed = True
-            if changed:
-                to_update_repos.append(obj)
-
-        else:
-            to_create_repos.append(GitHubRepo(github_id=github_id, **repo_fields))
-            to_create_user_links.append(UserGitHubRepo(user=user, repo=to_create_repos[-1]))
+    page_numbers = []
+    fetched_pages = []
 
-    with transaction.atomic():
-        if to_create_repos:
-            GitHubRepo.objects.bulk_create(to_create_repos)
-        if to_update_repos:
-            update_fields = [
-                "name",
-                "full_name",
-                "html_url",
-                "description",
-                "stargazers_count",
-                "forks_count",
-                "language",
-                "private",
-            ]
-            GitHubRepo.objects.bulk_update(to_update_repos, update_fields)
+    def modified_repos():
+        for page in iter_user_repos(token, validators, stream=streaming):
+            page_numbers.append(page.number)
+            if page.not_modified:
+                kept_ids.update(cached_pages[page.number].github_ids)
+                continue
+            record = GitHubRepoPage(user=user, number=page.number, etag=page.etag, last_modified=page.last_modified)
+            fetched_pages.append(record)
+            for repo in page.repos:
+                record.github_ids.append(repo["id"])
+                kept_ids.add(repo["id"])
+                yield repo
+
+    # Without streaming the whole listing is written at once; with it, peak memory is one chunk.
+    counts = Counter(created=0, updated=0, linked=0)
+    newest = state.high_water_mark
+    for chunk in batched(modified_repos(), settings.GITHUB_SYNC_CHUNK_SIZE if streaming else None):
+        with SYNC_PHASE_DURATION.labels("write").time():
+            counts.update(write_repos(user.pk, chunk, stale_summaries))
+        newest = newest_update(chunk, newest)
+    GitHubSyncState.objects.filter(user=user).update(high_water_mark=newest, reconciled_at=timezone.now())
+    if not fetched_pages:
+        logger.info("sync_repos: user id %s repos not modified", user.pk)
+        return {"ok": True, "not_modified": True}
+
+    with SYNC_PHASE_DURATION.labels("diff").time(), transaction.atomic():
+        disabled = 0
         if kept_ids:
-            UserGitHubRepo.objects.filter(user=user).exclude(repo__github_id__in=kept_ids).update(disabled=True)
-            UserGitHubRepo.objects.bulk_create(to_create_user_links)
+            disabled = (
+                UserGitHubRepo.objects.filter(user=user, disabled=False)
+                .exclude(repo__github_id__in=kept_ids)
+                .update(disabled=True, disabled_at=timezone.now())
+            )
+        if disabled:
+            GitHubSyncState.bump([user.pk])
+        GitHubRepoPage.objects.bulk_create(
+            fetched_pages,
+            update_conflicts=True,
+            unique_fields=["user", "number"],
+            update_fields=["etag", "last_modified", "github_ids"],
+        )
+        GitHubRepoPage.objects.filter(user=user, number__gt=max(page_numbers)).delete()
+    return {"ok": True, **counts, "disabled": disabled}
+
+
+def sync_run_key(run_id: str, outcome: str) -> str:
+    return f"sync-run:{run_id}:{outcome}"
+
+
+def count_sync_outcome(run_id: str, outcome: str) -> None:
+    key = sync_run_key(run_id, outcome)
+    cache.add(key, 0, settings.SYNC_SCHEDULER_SUMMARY_TTL)
+    cache.incr(key)
+
+
+@shared_task(ignore_result=True)
+def record_sync_result(result: dict, run_id: str):
+    if result.get("ok") and not result.get("not_modified"):
+        count_sync_outcome(run_id, "done")
+    else:
+        count_sync_outcome(run_id, "skipped")
+
+
+@shared_task(ignore_result=True)
+def record_sync_failure(run_id: str):
+    count_sync_outcome(run_id, "failed")
+
+
+@shared_task
+def summarize_sync_run(run_id: str, dispatched: int):
+    summary = {outcome: cache.get(sync_run_key(run_id, outcome), 0) for outcome in ("done", "skipped", "failed")}
+    summary["dispatched"] = dispatched
+    summary["pending"] = dispatched - summary["done"] - summary["skipped"] - summary["failed"]
+    logger.info("sync run %s: %s", run_id, summary)
+    return summary
+
+
+def stale_user_ids(limit: int) -> list:
+    """Users with a GitHub token whose repos were synced longest ago, never-synced users first.
+
+    Users whose GitHub account or token is gone are left out; their syncs would only be skipped, run after run.
+    """
+    never_synced = list(
+        User.objects.filter(
+            socialaccount__provider="github", socialaccount__socialtoken__isnull=False, github_sync_state__isnull=True
+        )
+        .distinct()
+        .values_list("pk", flat=True)[:limit]
+    )
+    cutoff = timezone.now() - timedelta(seconds=settings.SYNC_SCHEDULER_MIN_AGE)
+    stale = (
+        GitHubSyncState.objects.filter(Q(synced_at__lt=cutoff) | Q(synced_at__isnull=True))
+        .filter(user__socialaccount__provider="github", user__socialaccount__socialtoken__isnull=False)
+        .distinct()
+        .order_by(F("synced_at").asc(nulls_first=True))
+        .values_list("user_id", flat=True)[: limit - len(never_synced)]
+    )
+    return never_synced + list(stale)
+
+
+@shared_task
+def schedule_stale_syncs():
+    """Fan out ``sync_repos`` for the stalest users in spaced-out batches.
+
+    At most ``SYNC_SCHEDULER_BATCH_SIZE`` syncs are released every
+    ``SYNC_SCHEDULER_BATCH_INTERVAL`` seconds; outcomes are counted per run
+    and logged by ``summarize_sync_run`` once the last batch has had time to finish.
+    """
+    run_id = uuid.uuid4().hex
+    user_ids = stale_user_ids(settings.SYNC_SCHEDULER_MAX_USERS)
+    batches = list(batched(user_ids, settings.SYNC_SCHEDULER_BATCH_SIZE))
+    for number, batch in enumerate(batches):
+        signatures = []
+        for user_id in batch:
+            task_id, claimed = claim_sync(user_id, scheduled=True)
+            if not claimed:
+                count_sync_outcome(run_id, "skipped")
+                continue
+            signatures.append(
+                sync_repos.s(user_id).set(
+                    task_id=task_id,
+                    link=record_sync_result.s(run_id),
+                    link_error=record_sync_failure.si(run_id),
+                )
+            )
+        if signatures:
+            group(signatures).apply_async(countdown=number * settings.SYNC_SCHEDULER_BATCH_INTERVAL)
+    summarize_sync_run.apply_async(
+        (run_id, len(user_ids)),
+        countdown=len(batches) * settings.SYNC_SCHEDULER_BATCH_INTERVAL + settings.SYNC_SCHEDULER_SUMMARY_DELAY,
+    )
+    logger.info("sync run %s: dispatched %s syncs in %s batches", run_id, len(user_ids), len(batches))
+    return {"run_id": run_id, "dispatched": len(user_ids), "batches": len(batches)}
+
+
+def compaction_cursor_key(table: str) -> str:
+    return f"compaction-cursor:{table}"
+
+
+COMPACTION_TABLES = {"links": compact_links_batch, "repos": compact_repos_batch}
+COMPACTION_RUNNING_KEY = "compaction-running"
+
+
+@shared_task(ignore_result=True)
+def compact_repos(table: str = "links", batches: int = 0, reclaimed: Optional[dict] = None):
+    """Delete links disabled longer than ``COMPACTION_LINK_RETENTION`` and then orphaned repos.
+
+    Each task deletes one batch and schedules the next ``COMPACTION_BATCH_PAUSE`` seconds plus as long as
+    the batch took later, so the run backs off by itself when a busy database makes batches slow, without
+    holding a worker slot in between. Each table gets at most ``COMPACTION_MAX_BATCHES`` batches per run
+    and the position is kept in the cache, so a large table is walked over several runs.
+    """
+    if reclaimed is None:
+        # Started by beat: a run still working through its batches is left to finish.
+        if not cache.add(COMPACTION_RUNNING_KEY, True, settings.COMPACTION_RUN_TIMEOUT):
+            return None
+        reclaimed = {name: 0 for name in COMPACTION_TABLES}
+    started = time.monotonic()
+    cutoff = timezone.now() - timedelta(seconds=settings.COMPACTION_LINK_RETENTION)
+    cursor_key = compaction_cursor_key(table)
+    last_id, deleted = COMPACTION_TABLES[table](cache.get(cursor_key, 0), cutoff, settings.COMPACTION_BATCH_SIZE)
+    reclaimed[table] += deleted
+    COMPACTION_ROWS.labels(table).inc(deleted)
+    cache.set(cursor_key, last_id or 0, None)
+    batches += 1
+    if last_id is None or batches >= settings.COMPACTION_MAX_BATCHES:
+        tables = list(COMPACTION_TABLES)
+        if tables.index(table) == len(tables) - 1:
+            cache.delete(COMPACTION_RUNNING_KEY)
+            logger.info("compact_repos: deleted %s links and %s repos", reclaimed["links"], reclaimed["repos"])
+            return reclaimed
+        table, batches = tables[tables.index(table) + 1], 0
+    # The run stays claimed while it makes progress; a lost task frees it after COMPACTION_RUN_TIMEOUT.
+    cache.set(COMPACTION_RUNNING_KEY, True, settings.COMPACTION_RUN_TIMEOUT)
+    compact_repos.apply_async(
+        (table, batches, reclaimed), countdown=settings.COMPACTION_BATCH_PAUSE + time.monotonic() - started
+    )
+    return None
 
 
 # TODO servbot  Certbot
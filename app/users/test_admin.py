@@ -0,0 +1,109 @@
+from unittest import mock
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from users.models import GitHubRepo
+from users.models import GitHubRepoSummary
+from users.models import UserGitHubRepo
+from users.pagination import EstimatedCountPaginator
+
+User = get_user_model()
+
+
+def make_repo(github_id: int, owner: str = "octo") -> GitHubRepo:
+    return GitHubRepo.objects.create(
+        github_id=github_id,
+        name=f"repo-{github_id}",
+        full_name=f"{owner}/repo-{github_id}",
+        html_url=f"https://github.com/{owner}/repo-{github_id}",
+        stargazers_count=github_id,
+    )
+
+
+@pytest.mark.django_db
+class TestEstimatedCountPaginator:
+    def setup_method(self):
+        for github_id in range(1, 4):
+            make_repo(github_id)
+
+    def test_small_tables_are_counted_exactly(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {GitHubRepo._meta.db_table}")
+        paginator = EstimatedCountPaginator(GitHubRepo.objects.order_by("id"), 2)
+        assert paginator.count == 3
+        assert paginator.num_pages == 2
+
+    def test_unanalyzed_table_falls_back_to_exact_count(self):
+        paginator = EstimatedCountPaginator(GitHubRepo.objects.order_by("id"), 2)
+        with mock.patch.object(EstimatedCountPaginator, "exact_threshold", 0):
+            assert paginator.estimated_count() in (None, 3)
+            assert paginator.count == 3
+
+    def test_large_unfiltered_table_uses_reltuples(self):
+        paginator = EstimatedCountPaginator(GitHubRepo.objects.order_by("id"), 2)
+        with (
+            mock.patch.object(EstimatedCountPaginator, "exact_threshold", 0),
+            mock.patch.object(EstimatedCountPaginator, "estimated_count", return_value=5_000_000),
+            CaptureQueriesContext(connection) as queries,
+        ):
+            assert paginator.count == 5_000_000
+        assert not any("COUNT(" in query["sql"] for query in queries.captured_queries)
+
+    def test_filtered_queryset_uses_planner_estimate(self):
+        paginator = EstimatedCountPaginator(GitHubRepo.objects.filter(stargazers_count__gte=2).order_by("id"), 2)
+        with CaptureQueriesContext(connection) as queries:
+            estimate = paginator.estimated_count()
+        assert isinstance(estimate, int) and estimate >= 1
+        assert queries.captured_queries[0]["sql"].startswith("EXPLAIN")
+
+
+@pytest.mark.django_db
+class TestScalableAdmin:
+    def setup_method(self):
+        self.client = Client()
+        self.admin = User.objects.create_superuser(username="admin", email="admin@example.com", password="x")
+        self.client.force_login(self.admin)
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+        self.repos = [make_repo(1, "acme"), make_repo(2, "octo"), make_repo(1234, "octo")]
+        UserGitHubRepo.objects.create(user=self.alice, repo=self.repos[0])
+        UserGitHubRepo.objects.create(user=self.bob, repo=self.repos[1], disabled=True)
+        UserGitHubRepo.objects.create(user=self.bob, repo=self.repos[2])
+
+    def changelist(self, model, query: str = ""):
+        url = reverse(f"admin:users_{model._meta.model_name}_changelist")
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(f"{url}?{query}")
+        assert resp.status_code == 200
+        return resp.context["cl"], queries
+
+    def test_full_result_count_is_never_computed(self):
+        cl, queries = self.changelist(UserGitHubRepo, "disabled__exact=1")
+        assert cl.result_count == 1
+        assert cl.full_result_count is None
+        assert len(queries) < 10
+
+    def test_repo_search_by_name_or_github_id(self):
+        cl, _ = self.changelist(GitHubRepo, "q=ACME/")
+        assert [repo.pk for repo in cl.result_list] == [self.repos[0].pk]
+        cl, _ = self.changelist(GitHubRepo, "q=1234")
+        assert [repo.pk for repo in cl.result_list] == [self.repos[2].pk]
+
+    def test_link_search_by_username_prefix_or_repo(self):
+        cl, _ = self.changelist(UserGitHubRepo, "q=ali")
+        assert [link.user_id for link in cl.result_list] == [self.alice.pk]
+        cl, _ = self.changelist(UserGitHubRepo, "q=octo/repo-2")
+        assert [link.repo_id for link in cl.result_list] == [self.repos[1].pk]
+
+    def test_summary_changelist(self):
+        GitHubRepoSummary.objects.create(user=self.bob, repo_count=2, total_stars=1236)
+        cl, _ = self.changelist(GitHubRepoSummary)
+        assert [summary.user_id for summary in cl.result_list] == [self.bob.pk]
+
+    def test_unindexed_columns_are_not_sortable(self):
+        cl, _ = self.changelist(GitHubRepo)
+        assert set(cl.sortable_by) == {"id", "stargazers_count"}
@@ -0,0 +1,125 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from users.compaction import compact_links_batch
+from users.compaction import compact_repos_batch
+from users.models import GitHubRepo
+from users.models import GitHubSyncState
+from users.models import UserGitHubRepo
+from users.sync import upsert_links
+from users.tasks import COMPACTION_RUNNING_KEY
+from users.tasks import compact_repos
+from users.tasks import compaction_cursor_key
+
+User = get_user_model()
+
+
+def make_repo(github_id, refreshed_at=None):
+    return GitHubRepo.objects.create(
+        github_id=github_id,
+        name=f"r{github_id}",
+        full_name=f"u/r{github_id}",
+        html_url=f"http://r{github_id}",
+        refreshed_at=refreshed_at,
+    )
+
+
+@pytest.mark.django_db
+class TestCompaction:
+    def setup_method(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.cutoff = self.now - timedelta(days=30)
+        self.user = User.objects.create(username="tester")
+        GitHubSyncState.objects.create(user=self.user)
+        self.repos = [make_repo(github_id) for github_id in range(1, 5)]
+
+    def link(self, repo, disabled_at=None, disabled=True):
+        return UserGitHubRepo.objects.create(user=self.user, repo=repo, disabled=disabled, disabled_at=disabled_at)
+
+    def test_deletes_only_links_disabled_before_the_cutoff(self):
+        expired = self.link(self.repos[0], self.now - timedelta(days=31))
+        recent = self.link(self.repos[1], self.now - timedelta(days=1))
+        active = self.link(self.repos[2], disabled=False)
+        last_id, deleted = compact_links_batch(0, self.cutoff, 10)
+        assert deleted == 1
+        assert last_id == recent.pk
+        assert not UserGitHubRepo.objects.filter(pk=expired.pk).exists()
+        assert set(UserGitHubRepo.objects.values_list("pk", flat=True)) == {recent.pk, active.pk}
+        assert GitHubSyncState.objects.get(user=self.user).repo_version == 1
+        assert compact_links_batch(last_id, self.cutoff, 10) == (None, 0)
+
+    def test_links_disabled_before_tracking_start_their_retention_window(self):
+        legacy = self.link(self.repos[0])
+        assert compact_links_batch(0, self.cutoff, 10)[1] == 0
+        legacy.refresh_from_db()
+        assert legacy.disabled_at is not None
+
+    def test_batches_follow_the_primary_key(self):
+        links = [self.link(repo, self.now - timedelta(days=40)) for repo in self.repos]
+        last_id, deleted = compact_links_batch(0, self.cutoff, 2)
+        assert (last_id, deleted) == (links[1].pk, 2)
+        last_id, deleted = compact_links_batch(last_id, self.cutoff, 2)
+        assert (last_id, deleted) == (links[3].pk, 2)
+
+    def test_relinking_clears_disabled_at(self):
+        link = self.link(self.repos[0], self.now)
+        upsert_links(self.user.pk, [self.repos[0].github_id])
+        link.refresh_from_db()
+        assert (link.disabled, link.disabled_at) == (False, None)
+
+    def test_deletes_only_unlinked_repos_no_sync_wrote_recently(self):
+        self.link(self.repos[0], self.now - timedelta(days=31))
+        self.link(self.repos[1], disabled=False)
+        GitHubRepo.objects.filter(pk=self.repos[3].pk).update(refreshed_at=self.now)
+        last_id, deleted = compact_repos_batch(0, self.cutoff, 10)
+        assert last_id == self.repos[3].pk
+        assert deleted == 1
+        assert set(GitHubRepo.objects.values_list("github_id", flat=True)) == {1, 2, 4}
+
+    def run_compaction(self):
+        """Run a compaction chain in process; returns its result and the countdowns between its batches."""
+        countdowns = []
+        args = ()
+        with mock.patch.object(compact_repos, "apply_async") as apply_async:
+            while True:
+                apply_async.reset_mock()
+                result = compact_repos(*args)
+                if not apply_async.called:
+                    return result, countdowns
+                args = apply_async.call_args.args[0]
+                countdowns.append(apply_async.call_args.kwargs["countdown"])
+
+    def test_task_reclaims_links_then_orphans_and_schedules_each_batch(self, settings):
+        settings.COMPACTION_BATCH_SIZE = 1
+        settings.COMPACTION_BATCH_PAUSE = 5
+        for repo in self.repos[:2]:
+            self.link(repo, self.now - timedelta(days=31))
+        result, countdowns = self.run_compaction()
+        assert result == {"links": 2, "repos": 4}
+        # Three link batches, the last finding nothing, then five repo batches.
+        assert len(countdowns) == 3 + 5 - 1
+        assert all(countdown >= 5 for countdown in countdowns)
+        assert not GitHubRepo.objects.exists()
+        assert cache.get(COMPACTION_RUNNING_KEY) is None
+
+    def test_task_resumes_from_the_cached_cursor(self, settings):
+        settings.COMPACTION_BATCH_SIZE = 1
+        settings.COMPACTION_MAX_BATCHES = 2
+        assert self.run_compaction()[0] == {"links": 0, "repos": 2}
+        assert cache.get(compaction_cursor_key("repos")) == self.repos[1].pk
+        assert self.run_compaction()[0] == {"links": 0, "repos": 2}
+        assert not GitHubRepo.objects.exists()
+
+    def test_scheduled_run_is_skipped_while_one_is_in_progress(self):
+        with mock.patch.object(compact_repos, "apply_async") as apply_async:
+            compact_repos()
+            apply_async.assert_called_once()
+            apply_async.reset_mock()
+            assert compact_repos() is None
+        apply_async.assert_not_called()
+        assert GitHubRepo.objects.count() == len(self.repos)
@@ -0,0 +1,122 @@
+from unittest import mock
+
+import pytest
+from allauth.socialaccount.models import SocialAccount
+from allauth.socialaccount.models import SocialApp
+from allauth.socialaccount.models import SocialToken
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from users.adapter import SocialAccountAdapter
+from users.lookups import MISSING
+from users.lookups import SOCIAL_APPS_KEY
+from users.lookups import LocalCache
+from users.lookups import github_account
+from users.lookups import github_app
+from users.lookups import github_token
+from users.lookups import local_cache
+
+User = get_user_model()
+
+
+class TestLocalCache:
+    def test_evicts_the_least_recently_used_entry(self):
+        lru = LocalCache(max_entries=2)
+        lru.set("a", 1, 60)
+        lru.set("b", 2, 60)
+        assert lru.get("a") == 1
+        lru.set("c", 3, 60)
+        assert lru.get("b") is MISSING
+        assert (lru.get("a"), lru.get("c")) == (1, 3)
+
+    def test_entries_expire(self):
+        lru = LocalCache(max_entries=2)
+        with mock.patch("users.lookups.time.monotonic", return_value=100.0):
+            lru.set("a", None, 5)
+            assert lru.get("a") is None
+        with mock.patch("users.lookups.time.monotonic", return_value=105.0):
+            assert lru.get("a") is MISSING
+
+
+@pytest.mark.django_db
+class TestLookups:
+    def setup_method(self):
+        cache.clear()
+        local_cache.clear()
+        Site.objects.get_or_create(pk=settings.SITE_ID, defaults={"domain": "example.local", "name": "example.local"})
+        self.user = User.objects.create(username="tester")
+        self.app = SocialApp.objects.create(provider="github", name="GH", client_id="x", secret="s3cr3t")
+        self.app.sites.add(settings.SITE_ID)
+        self.account = SocialAccount.objects.create(
+            user=self.user, provider="github", uid="1", extra_data={"avatar_url": "https://a/1"}
+        )
+        self.client = Client()
+
+    def test_login_page_runs_no_queries_once_warm(self):
+        url = reverse("login_github")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        assert resp.status_code == 200
+        assert resp.context["github_app"].pk == self.app.pk
+        assert len(queries) == 0
+
+    def test_shared_cache_serves_other_processes(self):
+        github_app()
+        local_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            assert github_app().pk == self.app.pk
+        assert len(queries) == 0
+
+    def test_app_changes_are_seen_once_committed(self, django_capture_on_commit_callbacks):
+        url = reverse("login_github")
+        self.client.get(url)
+        with django_capture_on_commit_callbacks(execute=True):
+            self.app.sites.clear()
+            # Not before the commit, or another process could cache the old rows again.
+            assert cache.get(SOCIAL_APPS_KEY) is not None
+        with pytest.raises(SocialApp.DoesNotExist):
+            self.client.get(url)
+        with django_capture_on_commit_callbacks(execute=True):
+            self.app.sites.add(settings.SITE_ID)
+            self.app.delete()
+        assert github_app() is None
+
+    def test_account_changes_are_seen_once_committed(self, django_capture_on_commit_callbacks):
+        assert github_account(self.user.pk).extra_data["avatar_url"] == "https://a/1"
+        self.account.extra_data = {"avatar_url": "https://a/2"}
+        with django_capture_on_commit_callbacks(execute=True):
+            self.account.save()
+        assert github_account(self.user.pk).extra_data["avatar_url"] == "https://a/2"
+        with django_capture_on_commit_callbacks(execute=True):
+            self.account.delete()
+        assert github_account(self.user.pk) is None
+
+    def test_repos_page_reads_the_account_from_the_cache(self):
+        self.client.force_login(self.user)
+        url = reverse("github_repos")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        assert resp.context["avatar_url"] == "https://a/1"
+        assert not [query for query in queries if "socialaccount_socialaccount" in query["sql"]]
+
+    def test_app_secret_stays_out_of_the_shared_cache(self):
+        request = RequestFactory().get("/")
+        (app,) = SocialAccountAdapter().list_apps(request, provider="github")
+        assert app.secret == "s3cr3t"
+        assert "s3cr3t" not in repr(cache.get(SOCIAL_APPS_KEY))
+        assert github_app().secret == ""
+
+    def test_tokens_are_read_from_the_database(self):
+        assert github_token(self.user.pk) is None
+        SocialToken.objects.create(app=self.app, account=self.account, token="tok1")
+        with mock.patch("users.lookups.cache") as patched_cache:
+            assert github_token(self.user.pk) == "tok1"
+        assert not patched_cache.method_calls
@@ -0,0 +1,63 @@
+from http import HTTPStatus
+from unittest import mock
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.test import Client
+from django.test import override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from prometheus_client import CollectorRegistry
+from users.metrics import CeleryQueueCollector
+from users.metrics import count_queries
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+class TestMetrics:
+    def setup_method(self):
+        self.client = Client()
+
+    def test_metrics_endpoint_serves_prometheus_text(self):
+        conn = mock.MagicMock()
+        conn.__enter__.return_value.default_channel.queue_declare.return_value.message_count = 3
+        with mock.patch("users.metrics.current_app.connection_for_read", return_value=conn):
+            resp = self.client.get(reverse("metrics"))
+        assert resp.status_code == HTTPStatus.OK
+        assert resp["Content-Type"].startswith("text/plain")
+        body = resp.content.decode()
+        assert "# TYPE http_request_duration_seconds histogram" in body
+        assert "# TYPE github_sync_phase_duration_seconds histogram" in body
+        assert 'celery_queue_length{queue="celery"} 3.0' in body
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint_requires_token_when_configured(self):
+        assert self.client.get(reverse("metrics")).status_code == HTTPStatus.UNAUTHORIZED
+        resp = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        assert resp.status_code == HTTPStatus.OK
+
+    def test_middleware_records_latency_and_queries_by_view_name(self):
+        user = User.objects.create(username="tester")
+        self.client.force_login(user)
+        labels = {"view": "github_repos", "status": "200"}
+        before = REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) or 0
+        queries = REGISTRY.get_sample_value("http_request_db_queries_sum", {"view": "github_repos"}) or 0
+        assert self.client.get(reverse("github_repos")).status_code == HTTPStatus.OK
+        assert REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) == before + 1
+        assert REGISTRY.get_sample_value("http_request_db_queries_sum", {"view": "github_repos"}) > queries
+
+    def test_count_queries(self):
+        with count_queries() as queries:
+            list(User.objects.all())
+            User.objects.count()
+        assert queries.count == 2
+
+    def test_registering_the_queue_collector_does_not_reach_the_broker(self):
+        with mock.patch("users.metrics.current_app.connection_for_read") as patched_connection:
+            CollectorRegistry(auto_describe=True).register(CeleryQueueCollector())
+        patched_connection.assert_not_called()
+
+    def test_queue_collector_skips_metric_when_broker_is_down(self):
+        with mock.patch("users.metrics.current_app.connection_for_read", side_effect=OSError("down")):
+            assert list(CeleryQueueCollector().collect()) == []
@@ -0,0 +1,168 @@
+"""EXPLAIN checks for the repo listing and sync queries on a large seeded dataset.
+
+Seeding takes a while, so these tests only run on demand::
+
+    pytest -m explain
+    QUERY_PLAN_ROWS=200000 pytest -m explain
+"""
+
+import json
+import os
+
+import pytest
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import QueryDict
+from users.models import GitHubRepo
+from users.models import UserGitHubRepo
+from users.pagination import EstimatedCountPaginator
+from users.pagination import KeysetPaginator
+from users.views import REPOS_ORDERING
+from users.views import REPOS_SORTS
+from users.views import filter_repo_rows
+from users.views import repo_rows
+
+User = get_user_model()
+
+LINK_ROWS = int(os.environ.get("QUERY_PLAN_ROWS", 1_000_000))
+LINKS_PER_USER = 1000
+REPO_ROWS = LINK_ROWS // 5
+SEQ_SCAN_TABLES = {GitHubRepo._meta.db_table, UserGitHubRepo._meta.db_table}
+
+
+def seed(link_rows: int, links_per_user: int, repo_rows: int) -> None:
+    users = max(link_rows // links_per_user, 1)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {User._meta.db_table}
+                (username, password, is_superuser, is_staff, is_active, first_name, last_name, email, date_joined)
+            SELECT 'seed' || g, '', false, false, true, '', '', '', now() FROM generate_series(1, %s) g
+            """,
+            [users],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {GitHubRepo._meta.db_table}
+                (github_id, name, full_name, html_url, description, stargazers_count, forks_count, language, private)
+            SELECT g, 'r' || g, 'seed/r' || g, 'https://github.com/seed/r' || g, NULL,
+                   (g::bigint * 7919) %% 50000, g %% 100, 'Python', false
+            FROM generate_series(1, %s) g
+            """,
+            [repo_rows],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {UserGitHubRepo._meta.db_table} (user_id, repo_id, disabled)
+            SELECT u.id, r.id, (j %% 10 = 0)
+            FROM (SELECT id, row_number() OVER (ORDER BY id) AS n FROM {User._meta.db_table}
+                  WHERE username LIKE 'seed%%') u
+            CROSS JOIN generate_series(1, %s) j
+            JOIN {GitHubRepo._meta.db_table} r ON r.github_id = ((u.n * 7 + j * 13) %% %s) + 1
+            ON CONFLICT DO NOTHING
+            """,
+            [links_per_user, repo_rows],
+        )
+        cursor.execute(f"ANALYZE {User._meta.db_table}")
+        cursor.execute(f"ANALYZE {GitHubRepo._meta.db_table}")
+        cursor.execute(f"ANALYZE {UserGitHubRepo._meta.db_table}")
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def assert_index_driven(queryset):
+    plan = json.loads(queryset.explain(format="json"))[0]["Plan"]
+    nodes = list(plan_nodes(plan))
+    seq_scans = [node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"]
+    assert not SEQ_SCAN_TABLES.intersection(seq_scans), queryset.explain()
+    assert any("Index" in node["Node Type"] for node in nodes), queryset.explain()
+
+
+@pytest.fixture(scope="module")
+def seeded_user_id(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        seed(LINK_ROWS, LINKS_PER_USER, REPO_ROWS)
+        yield User.objects.filter(username__startswith="seed").order_by("pk").values_list("pk", flat=True)[1]
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {UserGitHubRepo._meta.db_table}, {GitHubRepo._meta.db_table}")
+        User.objects.filter(username__startswith="seed").delete()
+
+
+@pytest.mark.explain
+@pytest.mark.django_db
+class TestQueryPlans:
+    @pytest.fixture(autouse=True)
+    def seeded(self, seeded_user_id):
+        self.user = User.objects.get(pk=seeded_user_id)
+
+    def listing(self):
+        return repo_rows(self.user)
+
+    def test_repos_view_first_page(self):
+        paginator = KeysetPaginator(self.listing(), REPOS_ORDERING, 10)
+        assert_index_driven(paginator.queryset.order_by(*REPOS_ORDERING)[:11])
+
+    def test_repos_view_cursor_page(self):
+        paginator = KeysetPaginator(self.listing(), REPOS_ORDERING, 10)
+        page = paginator.page(1)
+        qs = self.listing().filter(paginator._seek([page.object_list[-1]["stargazers_count"], 0], forward=True))
+        assert_index_driven(qs.order_by(*REPOS_ORDERING)[:11])
+
+    def test_repos_view_filters_and_sorts(self):
+        params = QueryDict("language=Python&min_stars=100&max_stars=40000&private=false&disabled=false")
+        for ordering in REPOS_SORTS.values():
+            assert_index_driven(filter_repo_rows(self.listing(), params).order_by(*ordering)[:11])
+
+    def test_repos_view_search(self):
+        qs = filter_repo_rows(self.listing(), QueryDict("q=r4242"))
+        assert_index_driven(qs.order_by(*REPOS_ORDERING)[:11])
+
+    def test_search_across_all_repos_uses_trigram_index(self):
+        qs = GitHubRepo.objects.filter(full_name__icontains="r4242")
+        assert "users_repo_name_trgm_idx" in qs.explain()
+
+    def test_sync_disable_missing_links(self):
+        kept_ids = list(
+            UserGitHubRepo.objects.filter(user=self.user).values_list("repo__github_id", flat=True)[
+                : LINKS_PER_USER // 2
+            ]
+        )
+        qs = UserGitHubRepo.objects.filter(user=self.user, disabled=False).exclude(repo__github_id__in=kept_ids)
+        assert_index_driven(qs)
+
+    def test_sync_link_lookup(self):
+        assert_index_driven(UserGitHubRepo.objects.filter(user=self.user, repo__github_id__in=[1, 2, 3]))
+
+    def admin_changelist(self, model, search: str = "", **filters):
+        model_admin = admin.site._registry[model]
+        qs = model_admin.get_queryset(None).filter(**filters)
+        if search:
+            qs, _ = model_admin.get_search_results(None, qs, search)
+        return qs.order_by(*model_admin.get_ordering(None), "-pk")
+
+    def test_admin_links_changelist(self):
+        qs = self.admin_changelist(UserGitHubRepo)
+        assert EstimatedCountPaginator(qs, 100).count > EstimatedCountPaginator.exact_threshold
+        assert_index_driven(qs[:100])
+
+    def test_admin_disabled_links_filter(self):
+        qs = self.admin_changelist(UserGitHubRepo, disabled=True)
+        assert "users_link_disabled_idx" in qs[:100].explain()
+
+    def test_admin_links_search(self):
+        assert_index_driven(self.admin_changelist(UserGitHubRepo, "seed421")[:100])
+        assert_index_driven(self.admin_changelist(UserGitHubRepo, "seed/r4242")[:100])
+
+    def test_admin_repos_changelist_and_search(self):
+        assert_index_driven(self.admin_changelist(GitHubRepo)[:100])
+        assert_index_driven(self.admin_changelist(GitHubRepo, "r4242")[:100])
+        assert_index_driven(self.admin_changelist(GitHubRepo, "4242")[:100])
+
+    def test_compaction_scans_disabled_links_by_partial_index(self):
+        qs = UserGitHubRepo.objects.filter(disabled=True, pk__gt=LINK_ROWS // 2).order_by("pk")[:1000]
+        assert "users_link_disabled_idx" in qs.explain()
@@ -0,0 +1,590 @@
+import json
+import time
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+from unittest import mock
+
+import pytest
+from allauth.socialaccount.models import SocialAccount
+from allauth.socialaccount.models import SocialApp
+from allauth.socialaccount.models import SocialToken
+from celery import current_app
+from celery.canvas import Signature
+from celery.exceptions import Retry
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from users.metrics import CeleryQueueCollector
+from users.models import GitHubRepo
+from users.models import GitHubRepoPage
+from users.models import GitHubRepoSummary
+from users.models import GitHubSyncState
+from users.models import UserGitHubRepo
+from users.sync import refresh_summaries
+from users.sync import write_repos
+from users.tasks import apply_webhook_events
+from users.tasks import claim_sync
+from users.tasks import compact_repos
+from users.tasks import enqueue_sync
+from users.tasks import record_sync_failure
+from users.tasks import record_sync_result
+from users.tasks import schedule_stale_syncs
+from users.tasks import stale_user_ids
+from users.tasks import summarize_sync_run
+from users.tasks import sync_queued_key
+from users.tasks import sync_repos
+from users.tasks import sync_running_key
+from users.throttling import GitHubRateLimited
+from users.throttling import GitHubTransientError
+from users.throttling import GitHubUnavailable
+
+User = get_user_model()
+
+
+def make_repo(github_id, **fields):
+    data = {
+        "id": github_id,
+        "name": f"r{github_id}",
+        "full_name": f"u/r{github_id}",
+        "html_url": f"http://r{github_id}",
+        "description": None,
+        "stargazers_count": 0,
+        "forks_count": 0,
+        "language": None,
+        "private": False,
+    }
+    data.update(fields)
+    return data
+
+
+def stamped_repo(github_id, day, **fields):
+    return make_repo(github_id, updated_at=f"2026-01-{day:02d}T00:00:00Z", **fields)
+
+
+def make_response(repos, last=1, etag="", status_code=200):
+    response = mock.MagicMock()
+    response.status_code = status_code
+    response.json.return_value = repos
+    body = json.dumps(repos).encode()
+    response.iter_content.side_effect = lambda chunk_size: (body[i : i + 7] for i in range(0, len(body), 7))
+    response.headers = {"ETag": etag}
+    response.links = {}
+    if last > 1:
+        response.links = {"last": {"url": f"https://api.github.com/user/repos?per_page=100&page={last}"}}
+    return response
+
+
+class FakeSession:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+        self.params = []
+
+    def get(self, url, headers=None, params=None, timeout=None, stream=False):
+        self.calls.append(params["page"])
+        self.params.append(params)
+        if callable(self.pages):
+            return self.pages(params["page"])
+        repos = self.pages[params["page"] - 1]
+        etag = f'W/"{hash(str(repos))}"'
+        if headers.get("If-None-Match") == etag:
+            response = make_response(None, last=len(self.pages), etag=etag, status_code=304)
+            response.json.side_effect = AssertionError("304 body must not be decoded")
+            return response
+        return make_response(repos, last=len(self.pages), etag=etag)
+
+
+@pytest.mark.django_db
+class TestSyncRepos:
+    @pytest.fixture(autouse=True)
+    def rewrite_shared_repos(self, settings):
+        # These tests resync the same repos within seconds; TestSharedRepoFreshness covers the TTL.
+        settings.GITHUB_REPO_REFRESH_TTL = 0
+
+    def setup_method(self):
+        self.user = User.objects.create(username="tester")
+        app = SocialApp.objects.create(provider="github", name="GH", client_id="x", secret="s")
+        account = SocialAccount.objects.create(user=self.user, provider="github", uid="1", extra_data={})
+        SocialToken.objects.create(app=app, account=account, token="tok")
+
+    def run_sync(self, pages):
+        session = FakeSession(pages)
+        with mock.patch("users.github.get_session", return_value=session):
+            sync_repos(self.user.id)
+        return session
+
+    def run_sync_result(self, pages):
+        with mock.patch("users.github.get_session", return_value=FakeSession(pages)):
+            return sync_repos(self.user.id)
+
+    def test_sync_fetches_every_page_from_link_header(self):
+        pages = [[make_repo(page * 100 + i) for i in range(3)] for page in range(4)]
+        session = self.run_sync(pages)
+        assert sorted(session.calls) == [1, 2, 3, 4]
+        assert GitHubRepo.objects.count() == 12
+        assert UserGitHubRepo.objects.filter(user=self.user, disabled=False).count() == 12
+
+    def test_sync_updates_changed_repos_and_disables_missing(self):
+        self.run_sync([[make_repo(1), make_repo(2)]])
+        self.run_sync([[make_repo(1, stargazers_count=7)]])
+        assert GitHubRepo.objects.get(github_id=1).stargazers_count == 7
+        link = UserGitHubRepo.objects.get(repo__github_id=2)
+        assert link.disabled is True
+        assert link.disabled_at is not None
+
+    def test_sync_stores_page_validators_and_skips_unmodified(self):
+        pages = [[make_repo(1)], [make_repo(2)]]
+        self.run_sync(pages)
+        assert GitHubRepoPage.objects.filter(user=self.user).count() == 2
+        with mock.patch("users.tasks.write_repos") as patched_write:
+            session = FakeSession(pages)
+            with mock.patch("users.github.get_session", return_value=session):
+                result = sync_repos(self.user.id)
+        assert result == {"ok": True, "not_modified": True}
+        assert sorted(session.calls) == [1, 2]
+        patched_write.assert_not_called()
+
+    def test_sync_fetches_pages_added_behind_unmodified_ones(self):
+        pages = [[make_repo(1)], [make_repo(2)]]
+        self.run_sync(pages)
+        session = self.run_sync(pages + [[make_repo(3)]])
+        assert sorted(session.calls) == [1, 2, 3]
+        assert UserGitHubRepo.objects.filter(user=self.user, repo__github_id=3, disabled=False).exists()
+
+    def test_sync_keeps_links_of_unmodified_pages(self):
+        self.run_sync([[make_repo(1)], [make_repo(2)]])
+        self.run_sync([[make_repo(1)], [make_repo(3)]])
+        assert set(
+            UserGitHubRepo.objects.filter(user=self.user, disabled=False).values_list("repo__github_id", flat=True)
+        ) == {1, 3}
+        assert UserGitHubRepo.objects.get(repo__github_id=2).disabled is True
+
+    def test_sync_bumps_repo_version_of_every_linked_user(self):
+        other = User.objects.create(username="other")
+        GitHubSyncState.objects.create(user=other)
+        self.run_sync([[make_repo(1)]])
+        UserGitHubRepo.objects.create(user=other, repo=GitHubRepo.objects.get(github_id=1))
+        version = GitHubSyncState.objects.get(user=self.user).repo_version
+        self.run_sync([[make_repo(1, stargazers_count=3)]])
+        assert GitHubSyncState.objects.get(user=self.user).repo_version > version
+        assert GitHubSyncState.objects.get(user=other).repo_version == 1
+
+    def test_sync_links_repos_that_already_exist(self):
+        GitHubRepo.objects.create(github_id=1, name="r1", full_name="u/r1", html_url="http://r1")
+        result = self.run_sync_result([[make_repo(1)]])
+        assert UserGitHubRepo.objects.filter(user=self.user, repo__github_id=1, disabled=False).exists()
+        assert result["created"] == 0
+        assert result["linked"] == 1
+
+    def test_sync_skips_repos_with_unchanged_content_hash(self):
+        first = self.run_sync_result([[make_repo(1), make_repo(2)]])
+        assert first["created"] == 2
+        GitHubRepoPage.objects.all().delete()
+        second = self.run_sync_result([[make_repo(1), make_repo(2, forks_count=4)]])
+        assert second["created"] == 0
+        assert second["updated"] == 1
+        assert second["linked"] == 0
+
+    def test_sync_reenables_returning_repos(self):
+        self.run_sync([[make_repo(1), make_repo(2)]])
+        self.run_sync([[make_repo(1)]])
+        self.run_sync([[make_repo(1), make_repo(2)]])
+        assert not UserGitHubRepo.objects.filter(user=self.user, disabled=True).exists()
+
+    @override_settings(GITHUB_SYNC_STREAMING=True, GITHUB_SYNC_CHUNK_SIZE=2)
+    def test_streaming_sync_writes_in_chunks(self):
+        self.run_sync([[make_repo(1), make_repo(2), make_repo(3)], [make_repo(4)]])
+        GitHubRepoPage.objects.all().delete()
+        pages = [[make_repo(1), make_repo(2, stargazers_count=9), make_repo(5)], [make_repo(6)]]
+        with mock.patch("users.tasks.write_repos", wraps=write_repos) as patched_write:
+            result = self.run_sync_result(pages)
+        assert [len(call.args[1]) for call in patched_write.call_args_list] == [2, 2]
+        assert result == {"ok": True, "created": 2, "updated": 1, "linked": 2, "disabled": 2}
+        assert set(UserGitHubRepo.objects.filter(disabled=True).values_list("repo__github_id", flat=True)) == {3, 4}
+
+    def test_sync_stores_high_water_mark_and_reconcile_time(self):
+        self.run_sync([[stamped_repo(1, 1), stamped_repo(2, 5, pushed_at="2026-01-06T00:00:00Z")]])
+        state = GitHubSyncState.objects.get(user=self.user)
+        assert state.high_water_mark == datetime(2026, 1, 5, tzinfo=dt_timezone.utc)
+        assert state.reconciled_at is not None
+        repo = GitHubRepo.objects.get(github_id=2)
+        assert repo.pushed_at == datetime(2026, 1, 6, tzinfo=dt_timezone.utc)
+
+    def test_incremental_sync_reads_newest_first_and_stops_at_high_water_mark(self):
+        self.run_sync([[stamped_repo(i, i) for i in range(1, 6)]])
+        newest_first = [stamped_repo(7, 9), stamped_repo(5, 8, stargazers_count=3), stamped_repo(4, 4)]
+
+        def pages(page):
+            response = make_response([newest_first, [stamped_repo(3, 3)]][page - 1])
+            response.links = {"next": {"url": "https://api.github.com/user/repos?page=2"}}
+            return response
+
+        session = FakeSession(pages)
+        with mock.patch("users.github.get_session", return_value=session):
+            result = sync_repos(self.user.id)
+        assert session.calls == [1]
+        assert session.params[0]["sort"] == "updated"
+        assert session.params[0]["direction"] == "desc"
+        assert result == {"ok": True, "created": 1, "updated": 1, "linked": 1, "disabled": 0}
+        assert GitHubRepo.objects.get(github_id=5).stargazers_count == 3
+        assert not UserGitHubRepo.objects.filter(user=self.user, disabled=True).exists()
+        state = GitHubSyncState.objects.get(user=self.user)
+        assert state.high_water_mark == datetime(2026, 1, 9, tzinfo=dt_timezone.utc)
+
+    def test_incremental_sync_without_changes_is_not_modified(self):
+        self.run_sync([[stamped_repo(1, 1), stamped_repo(2, 2)]])
+        result = self.run_sync_result([[stamped_repo(2, 2), stamped_repo(1, 1)]])
+        assert result == {"ok": True, "not_modified": True}
+
+    def test_reconcile_after_interval_disables_deleted_repos(self):
+        self.run_sync([[stamped_repo(1, 1), stamped_repo(2, 2)]])
+        with override_settings(GITHUB_RECONCILE_INTERVAL=0):
+            session = self.run_sync([[stamped_repo(1, 1)]])
+        assert session.params[0]["sort"] == "created"
+        assert UserGitHubRepo.objects.get(repo__github_id=2).disabled is True
+
+    def test_sync_records_phase_timings_and_counters(self):
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        before = {
+            phase: sample("github_sync_phase_duration_seconds_count", phase=phase)
+            for phase in ("token", "fetch_page", "write", "diff")
+        }
+        created = sample("github_sync_repos_total", outcome="created")
+        synced = sample("github_sync_runs_total", result="synced")
+        queries = sample("github_sync_db_queries_count")
+        self.run_sync([[make_repo(1), make_repo(2)], [make_repo(3)]])
+        assert sample("github_sync_phase_duration_seconds_count", phase="token") == before["token"] + 1
+        assert sample("github_sync_phase_duration_seconds_count", phase="fetch_page") == before["fetch_page"] + 2
+        assert sample("github_sync_phase_duration_seconds_count", phase="write") == before["write"] + 1
+        assert sample("github_sync_phase_duration_seconds_count", phase="diff") == before["diff"] + 1
+        assert sample("github_sync_repos_total", outcome="created") == created + 3
+        assert sample("github_sync_runs_total", result="synced") == synced + 1
+        assert sample("github_sync_db_queries_count") == queries + 1
+
+
+@pytest.mark.django_db
+class TestSharedRepoFreshness:
+    def setup_method(self):
+        app = SocialApp.objects.create(provider="github", name="GH", client_id="x", secret="s")
+        self.users = []
+        for i in range(2):
+            user = User.objects.create(username=f"member{i}")
+            account = SocialAccount.objects.create(user=user, provider="github", uid=str(i), extra_data={})
+            SocialToken.objects.create(app=app, account=account, token=f"tok{i}")
+            self.users.append(user)
+
+    def sync(self, user, repos):
+        with mock.patch("users.github.get_session", return_value=FakeSession([repos])):
+            return sync_repos(user.id)
+
+    def test_recently_refreshed_repo_is_linked_but_not_rewritten_with_older_data(self):
+        self.sync(self.users[0], [make_repo(1, stargazers_count=2, updated_at="2024-01-02T00:00:00Z")])
+        result = self.sync(self.users[1], [make_repo(1, stargazers_count=1, updated_at="2024-01-01T00:00:00Z")])
+        assert result["updated"] == 0
+        assert result["linked"] == 1
+        assert GitHubRepo.objects.get(github_id=1).stargazers_count == 2
+
+    def test_recently_refreshed_repo_is_rewritten_with_newer_data(self):
+        self.sync(self.users[0], [make_repo(1, stargazers_count=1, updated_at="2024-01-01T00:00:00Z")])
+        result = self.sync(self.users[1], [make_repo(1, stargazers_count=2, updated_at="2024-01-02T00:00:00Z")])
+        assert result["updated"] == 1
+        assert GitHubRepo.objects.get(github_id=1).stargazers_count == 2
+
+    def test_own_earlier_sync_does_not_hide_newer_data(self):
+        self.sync(self.users[0], [make_repo(1, stargazers_count=1, updated_at="2024-01-01T00:00:00Z")])
+        with mock.patch("users.tasks.needs_reconcile", return_value=True):
+            result = self.sync(self.users[0], [make_repo(1, stargazers_count=2, updated_at="2024-01-02T00:00:00Z")])
+        assert result["updated"] == 1
+        assert GitHubRepo.objects.get(github_id=1).stargazers_count == 2
+        state = GitHubSyncState.objects.get(user=self.users[0])
+        assert state.high_water_mark == datetime(2024, 1, 2, tzinfo=dt_timezone.utc)
+
+    def test_repo_is_rewritten_once_its_refresh_expires(self):
+        self.sync(self.users[0], [make_repo(1, stargazers_count=1)])
+        GitHubRepo.objects.update(refreshed_at=timezone.now() - timedelta(seconds=settings.GITHUB_REPO_REFRESH_TTL + 1))
+        result = self.sync(self.users[1], [make_repo(1, stargazers_count=2)])
+        assert result["updated"] == 1
+        repo = GitHubRepo.objects.get(github_id=1)
+        assert repo.stargazers_count == 2
+        assert repo.refreshed_at > timezone.now() - timedelta(seconds=5)
+
+    def test_settled_repos_skip_the_upsert_statement(self):
+        self.sync(self.users[0], [make_repo(1), make_repo(2)])
+        GitHubRepo.objects.update(refreshed_at=None)
+        with CaptureQueriesContext(connection) as queries:
+            self.sync(self.users[1], [make_repo(1), make_repo(2)])
+        assert not [query for query in queries if query["sql"].lstrip().startswith("INSERT INTO users_githubrepo ")]
+        assert UserGitHubRepo.objects.filter(user=self.users[1]).count() == 2
+
+
+@pytest.mark.django_db
+class TestRepoSummary:
+    @pytest.fixture(autouse=True)
+    def rewrite_shared_repos(self, settings):
+        settings.GITHUB_REPO_REFRESH_TTL = 0
+
+    def setup_method(self):
+        app = SocialApp.objects.create(provider="github", name="GH", client_id="x", secret="s")
+        self.users = []
+        for i in range(2):
+            user = User.objects.create(username=f"member{i}")
+            account = SocialAccount.objects.create(user=user, provider="github", uid=str(i), extra_data={})
+            SocialToken.objects.create(app=app, account=account, token=f"tok{i}")
+            self.users.append(user)
+
+    def sync(self, user, repos):
+        with mock.patch("users.github.get_session", return_value=FakeSession([repos])):
+            return sync_repos(user.id)
+
+    def summary(self, user):
+        return GitHubRepoSummary.objects.get(user=user)
+
+    def test_sync_writes_totals_and_language_breakdown(self):
+        self.sync(
+            self.users[0],
+            [
+                make_repo(1, stargazers_count=5, forks_count=1, language="Python"),
+                make_repo(2, stargazers_count=3, forks_count=2, language="Python"),
+                make_repo(3, stargazers_count=1, language="Go"),
+                make_repo(4),
+            ],
+        )
+        summary = self.summary(self.users[0])
+        assert (summary.repo_count, summary.total_stars, summary.total_forks) == (4, 9, 3)
+        assert summary.languages == {"Python": 2, "Go": 1}
+        assert summary.top_languages(1) == [("Python", 2)]
+        assert summary.repo_version == GitHubSyncState.objects.get(user=self.users[0]).repo_version
+
+    def test_updated_and_disabled_repos_are_reflected(self):
+        self.sync(self.users[0], [make_repo(1, stargazers_count=5), make_repo(2, stargazers_count=3)])
+        self.sync(self.users[0], [make_repo(1, stargazers_count=8, language="Rust")])
+        summary = self.summary(self.users[0])
+        assert (summary.repo_count, summary.total_stars) == (1, 8)
+        assert summary.languages == {"Rust": 1}
+
+    def test_shared_repo_updated_by_another_sync_refreshes_every_linked_summary(self):
+        self.sync(self.users[0], [make_repo(1, stargazers_count=5)])
+        self.sync(self.users[1], [make_repo(1, stargazers_count=5)])
+        self.sync(self.users[1], [make_repo(1, stargazers_count=9)])
+        for user in self.users:
+            summary = self.summary(user)
+            assert summary.total_stars == 9
+            assert summary.repo_version == GitHubSyncState.objects.get(user=user).repo_version
+
+    def test_summary_query_stays_on_the_users_own_links(self):
+        self.sync(self.users[0], [make_repo(1), make_repo(2)])
+        with CaptureQueriesContext(connection) as queries:
+            self.sync(self.users[1], [make_repo(3)])
+        summary_sql = [query["sql"] for query in queries if "INSERT INTO users_githubreposummary" in query["sql"]]
+        assert len(summary_sql) == 1
+        assert f"ARRAY[{self.users[1].pk}]" in summary_sql[0]
+        assert self.summary(self.users[1]).repo_count == 1
+
+    @override_settings(GITHUB_SYNC_STREAMING=True, GITHUB_SYNC_CHUNK_SIZE=1)
+    def test_summary_is_refreshed_once_per_sync_not_per_chunk(self):
+        with mock.patch("users.sync.refresh_summaries", wraps=refresh_summaries) as patched_refresh:
+            self.sync(self.users[0], [make_repo(1, stargazers_count=2), make_repo(2), make_repo(3, stargazers_count=1)])
+        patched_refresh.assert_called_once_with([self.users[0].pk])
+        summary = self.summary(self.users[0])
+        assert (summary.repo_count, summary.total_stars) == (3, 3)
+        assert summary.repo_version == GitHubSyncState.objects.get(user=self.users[0]).repo_version
+
+
+@pytest.mark.django_db
+class TestSyncReposThrottling:
+    def setup_method(self):
+        cache.clear()
+        self.user = User.objects.create(username="tester")
+        app = SocialApp.objects.create(provider="github", name="GH", client_id="x", secret="s")
+        account = SocialAccount.objects.create(user=self.user, provider="github", uid="1", extra_data={})
+        SocialToken.objects.create(app=app, account=account, token="tok")
+
+    def teardown_method(self):
+        cache.clear()
+
+    def run_sync(self, respond):
+        with (
+            mock.patch("users.github.get_session", return_value=FakeSession(respond)),
+            mock.patch.object(sync_repos, "retry", side_effect=Retry()) as patched_retry,
+        ):
+            with pytest.raises(Retry):
+                sync_repos(self.user.id)
+        return patched_retry.call_args.kwargs
+
+    def test_retry_after_delays_the_task(self):
+        response = make_response([], status_code=403)
+        response.headers["Retry-After"] = "30"
+        kwargs = self.run_sync(lambda page: response)
+        assert isinstance(kwargs["exc"], GitHubRateLimited)
+        assert 30 <= kwargs["countdown"] <= 30 + settings.GITHUB_RETRY_BACKOFF_BASE
+
+    def test_low_budget_delays_until_reset_without_calling_github(self):
+        reset = int(time.time()) + 600
+        response = make_response([make_repo(1)])
+        response.headers.update({"X-RateLimit-Remaining": "50", "X-RateLimit-Reset": str(reset)})
+        with mock.patch("users.github.get_session", return_value=FakeSession(lambda page: response)):
+            sync_repos(self.user.id)
+        session = FakeSession(lambda page: response)
+        with (
+            mock.patch("users.github.get_session", return_value=session),
+            mock.patch.object(sync_repos, "retry", side_effect=Retry()) as patched_retry,
+        ):
+            with pytest.raises(Retry):
+                sync_repos(self.user.id)
+        assert session.calls == []
+        assert patched_retry.call_args.kwargs["countdown"] >= 590
+
+    def test_server_errors_retry_with_backoff_and_open_the_breaker(self):
+        for _ in range(settings.GITHUB_BREAKER_THRESHOLD):
+            kwargs = self.run_sync(lambda page: make_response(None, status_code=502))
+            assert isinstance(kwargs["exc"], GitHubTransientError)
+            assert 0 <= kwargs["countdown"] <= settings.GITHUB_RETRY_BACKOFF_BASE
+        kwargs = self.run_sync(lambda page: make_response([]))
+        assert isinstance(kwargs["exc"], GitHubUnavailable)
+
+
+@pytest.mark.django_db
+class TestSyncCoalescing:
+    def setup_method(self):
+        cache.clear()
+        self.user = User.objects.create(username="tester")
+
+    def teardown_method(self):
+        cache.clear()
+
+    def test_enqueue_sync_folds_triggers_into_the_queued_task(self):
+        with mock.patch.object(sync_repos, "apply_async") as patched_apply:
+            first_id, first_queued = enqueue_sync(self.user.pk)
+            second_id, second_queued = enqueue_sync(self.user.pk)
+        assert (first_queued, second_queued) == (True, False)
+        assert first_id == second_id
+        patched_apply.assert_called_once_with((self.user.pk,), task_id=first_id, queue=settings.SYNC_INTERACTIVE_QUEUE)
+
+    def test_trigger_does_not_wait_behind_a_pending_scheduled_sync(self):
+        scheduled_id, _ = claim_sync(self.user.pk, scheduled=True)
+        with mock.patch.object(sync_repos, "apply_async") as patched_apply:
+            task_id, queued = enqueue_sync(self.user.pk)
+            assert enqueue_sync(self.user.pk) == (task_id, False)
+        assert queued
+        assert task_id != scheduled_id
+        assert cache.get(sync_queued_key(self.user.pk)) == task_id
+        patched_apply.assert_called_once_with((self.user.pk,), task_id=task_id, queue=settings.SYNC_INTERACTIVE_QUEUE)
+
+    def test_trigger_while_running_schedules_one_follow_up(self):
+        cache.set(sync_queued_key(self.user.pk), "running-task")
+
+        def run(user_id):
+            cache.delete(sync_queued_key(user_id))
+            with mock.patch.object(sync_repos, "apply_async") as patched_apply:
+                ids = {enqueue_sync(user_id)[0] for _ in range(3)}
+            assert patched_apply.call_count == 1
+            return ids
+
+        with mock.patch("users.tasks.run_sync", side_effect=lambda task, user_id: run(user_id)):
+            ids = sync_repos.apply((self.user.pk,), task_id="running-task").get()
+        assert len(ids) == 1
+        assert cache.get(sync_queued_key(self.user.pk)) in ids
+        assert cache.get(sync_running_key(self.user.pk)) is None
+
+    def test_sync_waits_while_another_sync_of_the_user_runs(self):
+        cache.set(sync_running_key(self.user.pk), "other-task")
+        with (
+            mock.patch.object(Signature, "apply_async", autospec=True) as patched_send,
+            mock.patch("users.tasks.run_sync") as patched_run,
+        ):
+            sync_repos.apply((self.user.pk,), task_id="waiting-task", retries=2)
+        patched_run.assert_not_called()
+        (resent,) = [call.args[0] for call in patched_send.call_args_list]
+        assert resent.options["task_id"] == "waiting-task"
+        assert resent.options["countdown"] == settings.SYNC_LOCK_RETRY_DELAY
+        # Waiting for the lock does not count against the retries left for GitHub errors.
+        assert resent.options["retries"] == 2
+
+
+class TestTaskRouting:
+    def route(self, task, **options):
+        return current_app.amqp.router.route(options, task.name)["queue"].name
+
+    def test_syncs_run_on_the_bulk_lane_unless_a_user_is_waiting(self):
+        assert self.route(sync_repos) == settings.SYNC_BULK_QUEUE
+        assert self.route(sync_repos, queue=settings.SYNC_INTERACTIVE_QUEUE) == settings.SYNC_INTERACTIVE_QUEUE
+        assert self.route(compact_repos) == settings.SYNC_BULK_QUEUE
+        assert self.route(apply_webhook_events) == current_app.conf.task_default_queue
+
+    def test_queue_length_is_reported_for_every_lane(self):
+        conn = mock.MagicMock()
+        conn.__enter__.return_value.default_channel.queue_declare.return_value.message_count = 1
+        with mock.patch("users.metrics.current_app.connection_for_read", return_value=conn):
+            (family,) = CeleryQueueCollector().collect()
+        queues = {sample.labels["queue"] for sample in family.samples}
+        lanes = {current_app.conf.task_default_queue, settings.SYNC_INTERACTIVE_QUEUE, settings.SYNC_BULK_QUEUE}
+        assert queues == lanes
+
+    def test_syncs_are_acknowledged_late_and_store_no_result(self):
+        assert sync_repos.ignore_result and sync_repos.acks_late
+
+
+@pytest.mark.django_db
+class TestScheduleStaleSyncs:
+    def setup_method(self):
+        now = timezone.now()
+        self.app = SocialApp.objects.create(provider="github", name="GH", client_id="x", secret="s")
+        self.users = {}
+        for name, synced_at in (("fresh", now), ("old", now - timedelta(days=2)), ("older", now - timedelta(days=3))):
+            user = User.objects.create(username=name)
+            self.add_account(user, name)
+            GitHubSyncState.objects.create(user=user, synced_at=synced_at)
+            self.users[name] = user
+        self.users["never"] = User.objects.create(username="never")
+        self.add_account(self.users["never"], "never")
+
+    def add_account(self, user, uid, token=True):
+        account = SocialAccount.objects.create(user=user, provider="github", uid=uid, extra_data={})
+        if token:
+            SocialToken.objects.create(app=self.app, account=account, token=f"tok-{uid}")
+
+    def test_stale_user_ids_orders_by_staleness(self):
+        ids = [self.users[name].pk for name in ("never", "older", "old")]
+        assert stale_user_ids(10) == ids
+        assert stale_user_ids(2) == ids[:2]
+
+    def test_users_with_several_accounts_are_listed_once(self):
+        self.add_account(self.users["never"], "never-2")
+        self.add_account(self.users["old"], "old-2")
+        ids = [self.users[name].pk for name in ("never", "older", "old")]
+        assert stale_user_ids(10) == ids
+
+    def test_users_without_account_or_token_are_left_out(self):
+        SocialToken.objects.filter(account__user=self.users["older"]).delete()
+        SocialAccount.objects.filter(user=self.users["old"]).delete()
+        tokenless = User.objects.create(username="tokenless")
+        self.add_account(tokenless, "tokenless", token=False)
+        assert stale_user_ids(10) == [self.users["never"].pk]
+
+    @override_settings(SYNC_SCHEDULER_BATCH_SIZE=2, SYNC_SCHEDULER_BATCH_INTERVAL=10)
+    def test_schedule_stale_syncs_dispatches_spaced_batches(self):
+        with (
+            mock.patch("users.tasks.group") as patched_group,
+            mock.patch.object(summarize_sync_run, "apply_async") as patched_summary,
+        ):
+            result = schedule_stale_syncs()
+        assert result["dispatched"] == 3
+        assert result["batches"] == 2
+        countdowns = [call.kwargs["countdown"] for call in patched_group.return_value.apply_async.call_args_list]
+        assert countdowns == [0, 10]
+        assert patched_summary.call_args.args[0] == (result["run_id"], 3)
+
+    def test_sync_run_summary_counts_outcomes(self):
+        record_sync_result({"ok": True, "created": 1}, "run")
+        record_sync_result({"ok": True, "not_modified": True}, "run")
+        record_sync_result({"ok": False, "reason": "no_github_token"}, "run")
+        record_sync_failure("run")
+        assert summarize_sync_run("run", 5) == {"done": 1, "skipped": 2, "failed": 1, "dispatched": 5, "pending": 1}
@@ -1,5 +1,8 @@
+import json
+from datetime import timedelta
 from http import HTTPStatus
 from unittest import mock
+from urllib.parse import urlencode
 
 import pytest
 from allauth.socialaccount.models import SocialAccount
@@ -7,10 +10,18 @@ from allauth.socialaccount.models import SocialApp
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import connection
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from users.models import GitHubRepo
+from users.models import GitHubRepoSummary
+from users.models import GitHubSyncState
 from users.models import UserGitHubRepo
+from users.sync import refresh_summaries
+from users.tasks import sync_queued_key
 
 User = get_user_model()
 
@@ -107,19 +118,297 @@ class TestGitHubViews:
         assert any(item["full_name"] == "u/r1" for item in objs)
         assert any(item["full_name"] == "u/r2" and item["disabled"] is True for item in objs)
 
+    def test_github_repos_view_shows_precomputed_summary(self):
+        self.login()
+        SocialAccount.objects.create(user=self.user, provider="github", uid="1", extra_data={})
+        GitHubRepoSummary.objects.create(
+            user=self.user, repo_count=3, total_stars=42, total_forks=7, languages={"Go": 1, "Python": 2}
+        )
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse("github_repos"))
+        assert resp.context["summary"].total_stars == 42
+        assert "Python 2" in resp.content.decode()
+        assert not [query for query in queries if "sum(" in query["sql"].lower()]
+
     def test_trigger_sync_repos_starts_task_and_returns_json(self):
         self.login()
         SocialAccount.objects.create(user=self.user, provider="github", uid="1", extra_data={})
-        fake_async = mock.MagicMock()
-        fake_async.id = "task-123"
 
         with mock.patch("users.tasks.sync_repos", autospec=True) as patched_task:
-            patched_task.delay.return_value = fake_async
             url = reverse("trigger_sync_repos")
             resp = self.client.post(url)
             assert resp.status_code == HTTPStatus.ACCEPTED
+            task_id = patched_task.apply_async.call_args.kwargs["task_id"]
+            assert resp.json() == {"task_id": task_id, "queued": True}
+
+    def test_trigger_sync_repos_folds_into_queued_sync(self):
+        self.login()
+        cache.set(sync_queued_key(self.user.pk), "queued-task")
+        with mock.patch("users.tasks.sync_repos", autospec=True) as patched_task:
+            resp = self.client.post(reverse("trigger_sync_repos"))
+        assert resp.status_code == HTTPStatus.ACCEPTED
+        assert resp.json() == {"task_id": "queued-task", "queued": False}
+        patched_task.apply_async.assert_not_called()
+
+    def test_trigger_sync_repos_is_rate_limited_with_429(self):
+        self.login()
+        with mock.patch("users.tasks.sync_repos", autospec=True):
+            assert self.client.post(reverse("trigger_sync_repos")).status_code == HTTPStatus.ACCEPTED
+            resp = self.client.post(reverse("trigger_sync_repos"))
+        assert resp.status_code == HTTPStatus.TOO_MANY_REQUESTS
 
     def test_trigger_sync_repos_requires_login(self):
         url = reverse("trigger_sync_repos")
         resp = self.client.post(url)
         assert resp.status_code in (302, 401)
+
+    def test_github_repos_view_keyset_pages_follow_cursors(self):
+        self.login()
+        SocialAccount.objects.create(user=self.user, provider="github", uid="1", extra_data={})
+        for i in range(5):
+            repo = GitHubRepo.objects.create(
+                github_id=i, name=f"r{i}", full_name=f"u/r{i}", html_url=f"http://r{i}", stargazers_count=i % 2
+            )
+            UserGitHubRepo.objects.create(user=self.user, repo=repo)
+        url = reverse("github_repos")
+        first = self.client.get(url + "?page_size=2").context["repos"]
+        second = self.client.get(url, {"page_num": 2, "page_size": 2, "after": first.next_cursor}).context["repos"]
+        third = self.client.get(url, {"page_num": 3, "page_size": 2, "after": second.next_cursor}).context["repos"]
+        names = [item["full_name"] for page in (first, second, third) for item in page.object_list]
+        assert names == ["u/r3", "u/r1", "u/r4", "u/r2", "u/r0"]
+        assert not third.has_next()
+        assert [item["full_name"] for item in self.client.get(url + "?page_num=2&page_size=2").context["repos"]] == [
+            "u/r4",
+            "u/r2",
+        ]
+        back = self.client.get(url, {"page_num": 2, "page_size": 2, "before": third.previous_cursor}).context["repos"]
+        assert [item["full_name"] for item in back] == ["u/r4", "u/r2"]
+        assert back.has_previous()
+
+    def test_github_repos_view_invalid_cursor_raises_404(self):
+        self.login()
+        SocialAccount.objects.create(user=self.user, provider="github", uid="1", extra_data={})
+        resp = self.client.get(reverse("github_repos") + "?after=notacursor")
+        assert resp.status_code == 404
+
+    def test_github_repos_view_revalidates_with_etag_until_repo_version_changes(self):
+        self.login()
+        SocialAccount.objects.create(user=self.user, provider="github", uid="1", extra_data={})
+        GitHubSyncState.objects.create(user=self.user)
+        url = reverse("github_repos")
+        self.client.get(url)
+        resp = self.client.get(url)
+        assert resp.status_code == 200
+        etag = resp["ETag"]
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == HTTPStatus.NOT_MODIFIED
+        GitHubSyncState.bump([self.user.pk])
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == 200
+        assert resp["ETag"] != etag
+        assert "Last-Modified" in resp
+
+    def test_github_repos_view_revalidates_when_the_summary_is_refreshed(self):
+        self.login()
+        SocialAccount.objects.create(user=self.user, provider="github", uid="1", extra_data={})
+        GitHubSyncState.objects.create(user=self.user)
+        refresh_summaries([self.user.pk])
+        GitHubRepoSummary.objects.update(computed_at=timezone.now() - timedelta(minutes=1))
+        url = reverse("github_repos")
+        self.client.get(url)
+        etag = self.client.get(url)["ETag"]
+        assert self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTPStatus.NOT_MODIFIED
+        # Another user's sync updated a shared repo; this user's sync then refreshes only the summary.
+        refresh_summaries([self.user.pk])
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == 200
+        assert resp["ETag"] != etag
+        assert resp.context["summary"].repo_count == 0
+
+    def test_github_repos_view_caches_page_per_repo_version(self):
+        self.login()
+        SocialAccount.objects.create(user=self.user, provider="github", uid="1", extra_data={})
+        GitHubSyncState.objects.create(user=self.user)
+        repo = GitHubRepo.objects.create(github_id=1, name="r1", full_name="u/r1", html_url="http://r1")
+        UserGitHubRepo.objects.create(user=self.user, repo=repo)
+        url = reverse("github_repos")
+        self.client.get(url)
+        GitHubRepo.objects.filter(pk=repo.pk).update(full_name="u/renamed")
+        assert self.client.get(url).context["repos"].object_list[0]["full_name"] == "u/r1"
+        GitHubSyncState.bump([self.user.pk])
+        assert self.client.get(url).context["repos"].object_list[0]["full_name"] == "u/renamed"
+
+
+@pytest.mark.django_db
+class TestGitHubReposAPI:
+    def setup_method(self):
+        self.client = Client()
+        self.user = User.objects.create(username="tester")
+        self.client.force_login(self.user)
+        GitHubSyncState.objects.create(user=self.user)
+        for i in range(5):
+            repo = GitHubRepo.objects.create(
+                github_id=100 + i, name=f"r{i}", full_name=f"u/r{i}", html_url=f"http://r{i}", stargazers_count=i
+            )
+            UserGitHubRepo.objects.create(user=self.user, repo=repo, disabled=i == 0)
+
+    def test_requires_login(self):
+        resp = Client().get(reverse("github_repos_api"))
+        assert resp.status_code == HTTPStatus.UNAUTHORIZED
+
+    def test_pages_follow_next_and_previous_links(self):
+        first = self.client.get(reverse("github_repos_api"), {"page_size": 2}).json()
+        assert [repo["full_name"] for repo in first["results"]] == ["u/r4", "u/r3"]
+        assert first["previous"] is None
+        second = self.client.get(first["next"]).json()
+        third = self.client.get(second["next"]).json()
+        assert [repo["full_name"] for repo in third["results"]] == ["u/r0"]
+        assert third["results"][0]["disabled"] is True
+        assert third["next"] is None
+        back = self.client.get(third["previous"]).json()
+        assert [repo["full_name"] for repo in back["results"]] == ["u/r2", "u/r1"]
+
+    def test_fields_projection_selects_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse("github_repos_api"), {"fields": "github_id,full_name", "page_size": 1})
+        assert resp.json()["results"] == [{"github_id": 104, "full_name": "u/r4"}]
+        listing = next(query["sql"] for query in queries if "users_usergithubrepo" in query["sql"])
+        assert "html_url" not in listing
+        assert "description" not in listing
+
+    def test_rejects_unknown_fields_and_bad_page_size(self):
+        url = reverse("github_repos_api")
+        assert self.client.get(url, {"fields": "github_id,secret"}).json() == {"error": "Unknown fields: secret."}
+        assert self.client.get(url, {"page_size": 1000}).status_code == HTTPStatus.BAD_REQUEST
+        assert self.client.get(url, {"after": "notacursor"}).status_code == HTTPStatus.BAD_REQUEST
+
+    def test_revalidates_with_etag_and_compresses(self):
+        url = reverse("github_repos_api")
+        resp = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        assert resp["Content-Encoding"] == "gzip"
+        resp = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=resp["ETag"])
+        assert resp.status_code == HTTPStatus.NOT_MODIFIED
+        etag = resp["ETag"]
+        GitHubSyncState.bump([self.user.pk])
+        assert self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTPStatus.OK
+
+
+@pytest.mark.django_db
+class TestGitHubReposExport:
+    def setup_method(self):
+        self.client = Client()
+        self.user = User.objects.create(username="tester")
+        self.client.force_login(self.user)
+        for i in range(5):
+            repo = GitHubRepo.objects.create(
+                github_id=100 + i,
+                name=f"r{i}",
+                full_name=f"u/r{i}",
+                html_url=f"http://r{i}",
+                description="has, a comma" if i == 4 else None,
+                stargazers_count=i,
+                language="Go" if i % 2 else "Python",
+            )
+            UserGitHubRepo.objects.create(user=self.user, repo=repo, disabled=i == 0)
+
+    def export(self, **params):
+        resp = self.client.get(reverse("github_repos_export"), params)
+        assert resp.status_code == HTTPStatus.OK
+        return resp, b"".join(resp.streaming_content).decode()
+
+    def test_csv_export_streams_every_row_in_listing_order(self):
+        resp, body = self.export(fields="github_id,full_name,description,disabled")
+        assert resp.streaming
+        assert resp["Content-Type"] == "text/csv; charset=utf-8"
+        assert resp["Content-Disposition"] == 'attachment; filename="repos.csv"'
+        lines = body.splitlines()
+        assert lines[0] == "github_id,full_name,description,disabled"
+        assert lines[1] == '104,u/r4,"has, a comma",False'
+        assert [line.split(",")[0] for line in lines[1:]] == ["104", "103", "102", "101", "100"]
+
+    def test_ndjson_export_applies_filters_and_sort(self):
+        resp, body = self.export(format="ndjson", fields="full_name,language", language="Go", sort="name")
+        assert resp["Content-Type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in body.splitlines()]
+        assert rows == [{"full_name": "u/r1", "language": "Go"}, {"full_name": "u/r3", "language": "Go"}]
+
+    def test_header_goes_out_before_the_query_and_rows_follow_in_chunks(self):
+        with mock.patch("users.views.REPOS_EXPORT_CHUNK_SIZE", 2):
+            resp = self.client.get(reverse("github_repos_export"))
+            chunks = iter(resp.streaming_content)
+            with CaptureQueriesContext(connection) as queries:
+                header = next(chunks)
+            assert header.startswith(b"github_id,")
+            assert not queries.captured_queries
+            rest = list(chunks)
+        assert [chunk.count(b"\n") for chunk in rest] == [2, 2, 1]
+
+    def test_rejects_anonymous_and_bad_parameters(self):
+        url = reverse("github_repos_export")
+        assert Client().get(url).status_code == HTTPStatus.UNAUTHORIZED
+        assert self.client.get(url, {"format": "xml"}).status_code == HTTPStatus.BAD_REQUEST
+        assert self.client.get(url, {"fields": "secret"}).json() == {"error": "Unknown fields: secret."}
+        assert self.client.get(url, {"min_stars": "many"}).status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestGitHubReposFilters:
+    def setup_method(self):
+        self.client = Client()
+        self.user = User.objects.create(username="tester")
+        self.client.force_login(self.user)
+        SocialAccount.objects.create(user=self.user, provider="github", uid="1", extra_data={})
+        repos = [
+            ("u/django-app", "A Django site", 50, 3, "Python", False, False),
+            ("u/fastparser", "Parses logs quickly", 10, 9, "Rust", True, False),
+            ("u/old-tool", None, 5, 1, "Python", False, True),
+            ("u/notes", "Django cheat sheet", 1, 0, None, False, False),
+        ]
+        for i, (full_name, description, stars, forks, language, private, disabled) in enumerate(repos):
+            repo = GitHubRepo.objects.create(
+                github_id=i,
+                name=full_name.split("/")[1],
+                full_name=full_name,
+                html_url=f"http://{full_name}",
+                description=description,
+                stargazers_count=stars,
+                forks_count=forks,
+                language=language,
+                private=private,
+            )
+            UserGitHubRepo.objects.create(user=self.user, repo=repo, disabled=disabled)
+
+    def names(self, **params):
+        resp = self.client.get(reverse("github_repos"), params)
+        assert resp.status_code == HTTPStatus.OK
+        return [repo["full_name"] for repo in resp.context["repos"]]
+
+    def test_filters_by_language_stars_and_flags(self):
+        assert self.names(language="Python") == ["u/django-app", "u/old-tool"]
+        assert self.names(min_stars=5, max_stars=10) == ["u/fastparser", "u/old-tool"]
+        assert self.names(private="true") == ["u/fastparser"]
+        assert self.names(disabled="false", private="false") == ["u/django-app", "u/notes"]
+
+    def test_search_matches_name_or_description_case_insensitively(self):
+        assert self.names(q="DJANGO") == ["u/django-app", "u/notes"]
+        assert self.names(q="parse") == ["u/fastparser"]
+
+    def test_sorts_and_pages_with_filters_kept(self):
+        assert self.names(sort="forks") == ["u/fastparser", "u/django-app", "u/old-tool", "u/notes"]
+        first = self.client.get(reverse("github_repos"), {"sort": "name", "page_size": 2})
+        assert [repo["full_name"] for repo in first.context["repos"]] == ["u/django-app", "u/fastparser"]
+        assert "sort=name" in first.context["filter_query"]
+        cursor = urlencode({"after": first.context["repos"].next_cursor})
+        second = self.client.get(reverse("github_repos") + f"?{first.context['filter_query']}&page_num=2&{cursor}")
+        assert [repo["full_name"] for repo in second.context["repos"]] == ["u/notes", "u/old-tool"]
+
+    def test_invalid_filter_values(self):
+        url = reverse("github_repos")
+        assert self.client.get(url, {"sort": "random"}).status_code == HTTPStatus.NOT_FOUND
+        assert self.client.get(url, {"min_stars": "many"}).status_code == HTTPStatus.NOT_FOUND
+        resp = self.client.get(reverse("github_repos_api"), {"private": "maybe"})
+        assert resp.json() == {"error": "Invalid boolean: maybe."}
+
+    def test_api_applies_filters_and_sort(self):
+        resp = self.client.get(reverse("github_repos_api"), {"q": "django", "sort": "name", "fields": "full_name"})
+        assert resp.json()["results"] == [{"full_name": "u/django-app"}, {"full_name": "u/notes"}]
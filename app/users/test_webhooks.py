@@ -0,0 +1,196 @@
+import json
+from datetime import timedelta
+from http import HTTPStatus
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from allauth.socialaccount.models import SocialAccount
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from users.models import GitHubRepo
+from users.models import GitHubRepoSummary
+from users.models import GitHubSyncState
+from users.models import GitHubWebhookEvent
+from users.models import UserGitHubRepo
+from users.tasks import apply_webhook_events
+from users.webhooks import coalesce_events
+from users.webhooks import sign_payload
+
+User = get_user_model()
+
+SECRET = "webhook-secret"
+RECORDED = Path(__file__).resolve().parent / "testdata" / "github_webhooks.jsonl"
+
+
+def repo_payload(github_id, **fields):
+    data = {
+        "id": github_id,
+        "name": f"r{github_id}",
+        "full_name": f"octocat/r{github_id}",
+        "html_url": f"https://github.com/octocat/r{github_id}",
+        "owner": {"login": "octocat", "id": 1001},
+        "stargazers_count": 0,
+        "forks_count": 0,
+        "language": None,
+        "private": False,
+    }
+    data.update(fields)
+    return data
+
+
+@pytest.fixture(autouse=True)
+def webhook_secret(settings):
+    settings.GITHUB_WEBHOOK_SECRET = SECRET
+    cache.clear()
+
+
+@pytest.mark.django_db
+class TestWebhookReceiver:
+    def setup_method(self):
+        self.client = Client()
+        self.url = reverse("github_webhook")
+
+    def deliver(self, event, payload, delivery="d-1", signature=None):
+        body = json.dumps(payload).encode()
+        headers = {
+            "X-GitHub-Event": event,
+            "X-GitHub-Delivery": delivery,
+            "X-Hub-Signature-256": signature or sign_payload(SECRET, body),
+        }
+        return self.client.post(self.url, data=body, content_type="application/json", headers=headers)
+
+    def test_valid_delivery_is_queued_and_schedules_one_batch(self):
+        with mock.patch("users.tasks.apply_webhook_events", autospec=True) as task:
+            first = self.deliver("star", {"action": "created", "repository": repo_payload(1)}, delivery="d-1")
+            second = self.deliver("star", {"action": "created", "repository": repo_payload(1)}, delivery="d-2")
+        assert first.status_code == second.status_code == HTTPStatus.ACCEPTED
+        assert GitHubWebhookEvent.objects.count() == 2
+        task.apply_async.assert_called_once()
+
+    def test_bad_or_missing_signature_is_rejected(self):
+        resp = self.deliver("star", {"repository": repo_payload(1)}, signature="sha256=" + "0" * 64)
+        assert resp.status_code == HTTPStatus.FORBIDDEN
+        resp = self.client.post(self.url, data=b"{}", content_type="application/json")
+        assert resp.status_code == HTTPStatus.FORBIDDEN
+        assert not GitHubWebhookEvent.objects.exists()
+
+    def test_endpoint_is_off_without_a_secret(self, settings):
+        settings.GITHUB_WEBHOOK_SECRET = ""
+        assert self.deliver("star", {"repository": repo_payload(1)}).status_code == HTTPStatus.NOT_FOUND
+
+    def test_ping_and_unsupported_events_are_not_queued(self):
+        assert self.deliver("ping", {"zen": "Keep it logically awesome."}).status_code == HTTPStatus.OK
+        assert self.deliver("push", {"repository": repo_payload(1)}).status_code == HTTPStatus.NO_CONTENT
+        assert not GitHubWebhookEvent.objects.exists()
+
+    def test_redelivery_is_stored_once(self):
+        with mock.patch("users.tasks.apply_webhook_events", autospec=True):
+            self.deliver("star", {"repository": repo_payload(1)}, delivery="same")
+            self.deliver("star", {"repository": repo_payload(1)}, delivery="same")
+        assert GitHubWebhookEvent.objects.count() == 1
+
+    def test_rejects_non_object_payload(self):
+        assert self.deliver("star", [1, 2]).status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestApplyWebhookEvents:
+    def setup_method(self):
+        self.octocat = User.objects.create(username="octocat")
+        self.hubot = User.objects.create(username="hubot")
+        for user, uid in ((self.octocat, "1001"), (self.hubot, "1002")):
+            SocialAccount.objects.create(user=user, provider="github", uid=uid, extra_data={})
+            GitHubSyncState.objects.create(user=user)
+
+    def queue(self, *events):
+        for number, (event, payload) in enumerate(events):
+            GitHubWebhookEvent.objects.create(delivery_id=f"d-{number}", event=event, payload=payload)
+
+    def test_events_are_coalesced_per_repo(self):
+        events = [
+            GitHubWebhookEvent(event="star", payload={"repository": repo_payload(1, stargazers_count=1)}),
+            GitHubWebhookEvent(event="star", payload={"repository": repo_payload(1, stargazers_count=2)}),
+            GitHubWebhookEvent(event="repository", payload={"action": "created", "repository": repo_payload(2)}),
+            GitHubWebhookEvent(event="repository", payload={"action": "deleted", "repository": repo_payload(2)}),
+        ]
+        batch = coalesce_events(events)
+        assert batch.repos[1]["stargazers_count"] == 2
+        assert 2 not in batch.repos and 2 not in batch.owners
+        assert batch.deleted == {2}
+
+    def test_batch_writes_each_repo_once(self):
+        self.queue(*[("star", {"repository": repo_payload(1, stargazers_count=n)}) for n in range(1, 6)])
+        with CaptureQueriesContext(connection) as queries:
+            result = apply_webhook_events()
+        inserts = [query for query in queries if query["sql"].lstrip().startswith("INSERT INTO users_githubrepo ")]
+        assert len(inserts) == 1
+        assert result["events"] == 5
+        assert GitHubRepo.objects.get(github_id=1).stargazers_count == 5
+        assert not GitHubWebhookEvent.objects.exists()
+
+    def test_webhook_overrides_recent_sync_refresh(self):
+        GitHubRepo.objects.create(
+            github_id=1, name="r1", full_name="octocat/r1", html_url="https://x", refreshed_at=timezone.now()
+        )
+        self.queue(("star", {"repository": repo_payload(1, stargazers_count=9)}))
+        apply_webhook_events()
+        repo = GitHubRepo.objects.get(github_id=1)
+        assert repo.stargazers_count == 9
+        assert repo.refreshed_at > timezone.now() - timedelta(seconds=5)
+
+    def test_updated_shared_repo_bumps_every_linked_user(self):
+        repo = GitHubRepo.objects.create(github_id=1, name="r1", full_name="octocat/r1", html_url="https://x")
+        UserGitHubRepo.objects.create(user=self.hubot, repo=repo)
+        self.queue(("star", {"repository": repo_payload(1, stargazers_count=3)}))
+        apply_webhook_events()
+        assert GitHubSyncState.objects.get(user=self.hubot).repo_version == 1
+        summary = GitHubRepoSummary.objects.get(user=self.hubot)
+        assert (summary.total_stars, summary.repo_version) == (3, 1)
+
+    def test_malformed_events_are_dropped_without_blocking_the_queue(self):
+        no_id = repo_payload(2)
+        del no_id["id"]
+        self.queue(
+            ("star", {"repository": no_id}),
+            ("star", {"repository": repo_payload(3, updated_at="yesterday")}),
+            ("repository", {"action": "created", "repository": repo_payload(4, name="x" * 301)}),
+            ("fork", {"repository": repo_payload(5), "forkee": repo_payload(6, private=None)}),
+            ("repository", {"action": "deleted", "repository": {"id": "7"}}),
+            ("star", {"repository": repo_payload(1, stargazers_count=4)}),
+        )
+        result = apply_webhook_events()
+        assert (result["events"], result["dropped"], result["created"]) == (6, 5, 1)
+        assert list(GitHubRepo.objects.values_list("github_id", "stargazers_count")) == [(1, 4)]
+        assert not GitHubWebhookEvent.objects.exists()
+
+    def test_full_batch_schedules_the_next_one(self, settings):
+        settings.GITHUB_WEBHOOK_BATCH_SIZE = 2
+        self.queue(*[("star", {"repository": repo_payload(n)}) for n in range(1, 4)])
+        with mock.patch.object(apply_webhook_events, "delay") as delay:
+            assert apply_webhook_events()["events"] == 2
+        delay.assert_called_once_with()
+        assert GitHubWebhookEvent.objects.count() == 1
+
+    def test_replay_of_recorded_deliveries_end_to_end(self):
+        out = StringIO()
+        call_command("replay_github_webhooks", str(RECORDED), "--apply", stdout=out)
+        assert "push 7b2e2f40-0000-4000-8000-000000000008 -> 204" in out.getvalue()
+
+        spoon = GitHubRepo.objects.get(github_id=5001)
+        assert (spoon.stargazers_count, spoon.forks_count, spoon.description) == (2, 1, "Fork me")
+        fork = GitHubRepo.objects.get(github_id=5002)
+        assert fork.full_name == "hubot/spoon-knife"
+        assert UserGitHubRepo.objects.filter(user=self.hubot, repo=fork, disabled=False).exists()
+        assert UserGitHubRepo.objects.filter(user=self.octocat, repo=spoon, disabled=False).exists()
+        # Created and deleted within one batch: the deletion wins and nothing is linked.
+        assert not UserGitHubRepo.objects.filter(repo__github_id=5003, disabled=False).exists()
+        assert not GitHubWebhookEvent.objects.exists()
+        assert self.octocat.github_repo_summary.total_stars == 2
@@ -0,0 +1,99 @@
+import hashlib
+import random
+import time
+from http import HTTPStatus
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+BREAKER_FAILURES_KEY = "github-breaker:failures"
+BREAKER_OPEN_KEY = "github-breaker:open-until"
+
+
+class GitHubThrottled(Exception):
+    """GitHub must not be called for ``retry_after`` seconds; the task should be delayed, not failed."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(retry_after, 1)
+
+
+class GitHubRateLimited(GitHubThrottled):
+    pass
+
+
+class GitHubUnavailable(GitHubThrottled):
+    pass
+
+
+class GitHubTransientError(Exception):
+    pass
+
+
+def budget_key(token: str) -> str:
+    return f"github-budget:{hashlib.sha256(token.encode()).hexdigest()[:16]}"
+
+
+def acquire(token: str) -> None:
+    """Take one request from the token's budget shared by every worker.
+
+    The budget mirrors GitHub's ``X-RateLimit-Remaining`` and is refilled by :func:`observe`;
+    until a response has been seen for the token it is not enforced.
+    """
+    now = time.time()
+    open_until = cache.get(BREAKER_OPEN_KEY)
+    if open_until and open_until > now:
+        raise GitHubUnavailable("GitHub circuit breaker is open", open_until - now)
+    key = budget_key(token)
+    try:
+        remaining = cache.decr(key)
+    except ValueError:
+        return
+    if remaining < settings.GITHUB_RATE_LIMIT_RESERVE:
+        reset = cache.get(f"{key}:reset") or now + 60
+        raise GitHubRateLimited("GitHub rate limit budget exhausted", reset - now)
+
+
+def observe(token: str, response: requests.Response) -> None:
+    """Record rate limit headers and raise for throttled or failed responses."""
+    now = time.time()
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    reset = response.headers.get("X-RateLimit-Reset")
+    if remaining is not None and reset is not None:
+        key = budget_key(token)
+        timeout = max(int(reset) - now, 1)
+        cache.set_many({key: int(remaining), f"{key}:reset": int(reset)}, timeout)
+
+    if response.status_code in (HTTPStatus.FORBIDDEN, HTTPStatus.TOO_MANY_REQUESTS):
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            raise GitHubRateLimited("GitHub asked to retry later", float(retry_after))
+        if remaining == "0" and reset is not None:
+            raise GitHubRateLimited("GitHub rate limit exhausted", int(reset) - now)
+    if response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+        record_failure()
+        raise GitHubTransientError(f"GitHub responded with {response.status_code}")
+    record_success()
+
+
+def record_failure() -> None:
+    cache.add(BREAKER_FAILURES_KEY, 0, settings.GITHUB_BREAKER_WINDOW)
+    if cache.incr(BREAKER_FAILURES_KEY) >= settings.GITHUB_BREAKER_THRESHOLD:
+        cooldown = settings.GITHUB_BREAKER_COOLDOWN
+        cache.set(BREAKER_OPEN_KEY, time.time() + cooldown, cooldown)
+        cache.delete(BREAKER_FAILURES_KEY)
+
+
+def record_success() -> None:
+    cache.delete(BREAKER_FAILURES_KEY)
+
+
+def backoff_delay(retries: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(settings.GITHUB_RETRY_BACKOFF_MAX, settings.GITHUB_RETRY_BACKOFF_BASE * 2**retries))
+
+
+def throttled_delay(retry_after: float) -> float:
+    # Spread retries out so every delayed task does not wake up at the same reset second.
+    return retry_after + random.uniform(0, settings.GITHUB_RETRY_BACKOFF_BASE)
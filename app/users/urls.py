@@ -7,5 +7,8 @@ urlpatterns = [
     path("login/", views.GitHubLoginView.as_view(), name="login_github"),
     path("", include("allauth.urls")),
     path("github/repos/", views.GitHubReposView.as_view(), name="github_repos"),
+    path("github/repos.json", views.github_repos_api, name="github_repos_api"),
+    path("github/repos/export/", views.github_repos_export, name="github_repos_export"),
     path("github/repos/trigger_sync/", views.trigger_sync_repos, name="trigger_sync_repos"),
+    path("github/webhook/", views.github_webhook, name="github_webhook"),
 ]
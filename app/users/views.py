@@ -1,23 +1,204 @@
+import csv
+import hashlib
+import json
+from datetime import datetime
 from http import HTTPStatus
 from typing import Any
 from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
 
-from allauth.socialaccount.models import SocialAccount
-from allauth.socialaccount.models import SocialApp
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.paginator import EmptyPage
-from django.core.paginator import PageNotAnInteger
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models import Q
+from django.db.models import QuerySet
 from django.http import Http404
 from django.http import HttpRequest
 from django.http import HttpResponse
+from django.http import JsonResponse
+from django.http import QueryDict
+from django.http import StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from django.views.decorators.http import require_GET
 from django.views.decorators.http import require_POST
 from django.views.generic import TemplateView
 from django_ratelimit.decorators import ratelimit
-from users.tasks import sync_repos as sync_repos_task
+from prometheus_client import CONTENT_TYPE_LATEST
+from users.tasks import enqueue_sync
+from users.tasks import enqueue_webhook_apply
 
+from .lookups import github_account
+from .lookups import github_app
+from .metrics import render_metrics
+from .models import GitHubRepoSummary
+from .models import GitHubSyncState
+from .models import GitHubWebhookEvent
 from .models import UserGitHubRepo
+from .pagination import KeysetPage
+from .pagination import KeysetPaginator
+from .sync import batched
+from .webhooks import WEBHOOK_EVENTS
+from .webhooks import verify_signature
+
+REPOS_ORDERING = ("-stargazers_count", "-repo_id")
+# Every ordering ends with repo_id so it is a unique key for the keyset cursors.
+REPOS_SORTS = {
+    "stars": REPOS_ORDERING,
+    "forks": ("-forks_count", "-repo_id"),
+    "name": ("full_name", "repo_id"),
+}
+BOOLEAN_PARAMS = {"true": True, "1": True, "yes": True, "false": False, "0": False, "no": False}
+
+# Public field name of the JSON API -> lookup from UserGitHubRepo.
+REPOS_API_FIELDS = {
+    "github_id": "repo__github_id",
+    "name": "repo__name",
+    "full_name": "repo__full_name",
+    "html_url": "repo__html_url",
+    "description": "repo__description",
+    "stargazers_count": "repo__stargazers_count",
+    "forks_count": "repo__forks_count",
+    "language": "repo__language",
+    "private": "repo__private",
+    "disabled": "disabled",
+}
+REPOS_API_DEFAULT_PAGE_SIZE = 50
+REPOS_API_MAX_PAGE_SIZE = 100
+# Export format -> content type; rows are fetched from a server-side cursor REPOS_EXPORT_CHUNK_SIZE at a time.
+REPOS_EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+REPOS_EXPORT_CHUNK_SIZE = 2000
+
+
+def repo_rows(user) -> QuerySet:
+    """The user's repo links as template-ready dicts, selecting only the displayed columns."""
+    return UserGitHubRepo.objects.filter(user=user).values(
+        "repo_id",
+        "disabled",
+        full_name=F("repo__full_name"),
+        html_url=F("repo__html_url"),
+        description=F("repo__description"),
+        stargazers_count=F("repo__stargazers_count"),
+        forks_count=F("repo__forks_count"),
+        language=F("repo__language"),
+        private=F("repo__private"),
+    )
+
+
+def repo_api_rows(user, fields: List[str], ordering: Sequence[str] = REPOS_ORDERING) -> QuerySet:
+    """The user's repo links with only ``fields`` selected, plus the keys ``ordering`` needs."""
+    lookups = {name: REPOS_API_FIELDS[name] for name in fields}
+    for field in ordering:
+        name = field.lstrip("-")
+        if name != "repo_id":
+            lookups.setdefault(name, REPOS_API_FIELDS[name])
+    plain = [name for name, lookup in lookups.items() if name == lookup]
+    aliased = {name: F(lookup) for name, lookup in lookups.items() if name != lookup}
+    return UserGitHubRepo.objects.filter(user=user).values("repo_id", *plain, **aliased)
+
+
+def requested_fields(params: QueryDict) -> List[str]:
+    """The ``fields`` parameter as a list, all of ``REPOS_API_FIELDS`` when it is empty."""
+    fields = [name for name in params.get("fields", "").split(",") if name] or list(REPOS_API_FIELDS)
+    unknown = sorted(set(fields) - set(REPOS_API_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_boolean(value: str) -> bool:
+    try:
+        return BOOLEAN_PARAMS[value.lower()]
+    except KeyError:
+        raise ValueError(f"Invalid boolean: {value}")
+
+
+def parse_integer(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid integer: {value}")
+
+
+def repos_ordering(params: QueryDict) -> Sequence[str]:
+    sort = params.get("sort") or "stars"
+    if sort not in REPOS_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    return REPOS_SORTS[sort]
+
+
+def filter_repo_rows(queryset: QuerySet, params: QueryDict) -> QuerySet:
+    """Apply the listing filters from query parameters; raises ``ValueError`` on malformed values.
+
+    The search uses ``icontains``, i.e. ``UPPER(column) LIKE UPPER('%q%')``, which the
+    ``gin_trgm_ops`` expression indexes on ``GitHubRepo`` serve without a sequential scan.
+    """
+    filters = Q()
+    if params.get("language"):
+        filters &= Q(repo__language=params["language"])
+    if params.get("min_stars"):
+        filters &= Q(repo__stargazers_count__gte=parse_integer(params["min_stars"]))
+    if params.get("max_stars"):
+        filters &= Q(repo__stargazers_count__lte=parse_integer(params["max_stars"]))
+    if params.get("private"):
+        filters &= Q(repo__private=parse_boolean(params["private"]))
+    if params.get("disabled"):
+        filters &= Q(disabled=parse_boolean(params["disabled"]))
+    search = params.get("q", "").strip()
+    if search:
+        filters &= Q(repo__full_name__icontains=search) | Q(repo__description__icontains=search)
+    return queryset.filter(filters)
+
+
+def get_sync_state(request: HttpRequest) -> Optional[GitHubSyncState]:
+    if not hasattr(request, "_github_sync_state"):
+        request._github_sync_state = GitHubSyncState.objects.filter(user=request.user).first()
+    return request._github_sync_state
+
+
+def get_repo_summary(request: HttpRequest) -> Optional[GitHubRepoSummary]:
+    if not hasattr(request, "_github_repo_summary"):
+        request._github_repo_summary = GitHubRepoSummary.objects.filter(user=request.user).first()
+    return request._github_repo_summary
+
+
+def repos_etag(request: HttpRequest, *args: Any, **kwargs: Any) -> Optional[str]:
+    state = get_sync_state(request)
+    if state is None:
+        return None
+    # The page also shows the summary, which a sync refreshes without moving repo_version.
+    summary = get_repo_summary(request)
+    summary_key = f"{summary.repo_version}:{summary.computed_at.isoformat()}" if summary and summary.computed_at else ""
+    # The page embeds a CSRF token, so a rotated CSRF secret must invalidate the browser copy too.
+    csrf_key = request.META.get("CSRF_COOKIE", "")
+    key = f"{state.user_id}:{state.repo_version}:{summary_key}:{request.get_full_path()}:{csrf_key}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def repos_api_etag(request: HttpRequest, *args: Any, **kwargs: Any) -> Optional[str]:
+    state = get_sync_state(request)
+    if state is None:
+        return None
+    return hashlib.sha256(f"{state.user_id}:{state.repo_version}:{request.get_full_path()}".encode()).hexdigest()
+
+
+def repos_last_modified(request: HttpRequest, *args: Any, **kwargs: Any) -> Optional[datetime]:
+    state = get_sync_state(request)
+    return state.repos_changed_at if state else None
+
+
+def repos_page_last_modified(request: HttpRequest, *args: Any, **kwargs: Any) -> Optional[datetime]:
+    summary = get_repo_summary(request)
+    changed = [repos_last_modified(request), summary.computed_at if summary else None]
+    return max((moment for moment in changed if moment is not None), default=None)
 
 
 class GitHubLoginView(TemplateView):
@@ -25,44 +206,25 @@ class GitHubLoginView(TemplateView):
 
     def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        context["github_app"] = SocialApp.objects.filter(provider="github").first()
+        context["github_app"] = github_app()
         return context
 
 
+@method_decorator(condition(etag_func=repos_etag, last_modified_func=repos_page_last_modified), name="get")
 class GitHubReposView(LoginRequiredMixin, TemplateView):
     template_name = "github_repos.html"
 
     def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        try:
-            account = SocialAccount.objects.get(user=self.request.user, provider="github")
-            context["avatar_url"] = account.extra_data.get("avatar_url")
-        except SocialAccount.DoesNotExist:
+        account = github_account(self.request.user.pk)
+        if account is None:
             context["error"] = "GitHub account not found."
             return context
+        context["avatar_url"] = account.extra_data.get("avatar_url")
 
-        links_qs = (
-            UserGitHubRepo.objects.select_related("repo")
-            .filter(user=self.request.user)
-            .order_by("-repo__stargazers_count")
-        )
-
-        repos_list = []
-        for link in links_qs:
-            r = link.repo
-            repos_list.append(
-                {
-                    "full_name": r.full_name,
-                    "html_url": r.html_url,
-                    "description": r.description,
-                    "stargazers_count": r.stargazers_count,
-                    "forks_count": r.forks_count,
-                    "language": r.language,
-                    "disabled": link.disabled,
-                    "private": r.private,
-                }
-            )
-
+        context["summary"] = get_repo_summary(self.request)
+        context["filter_query"] = self.filter_query()
+        context["sorts"] = list(REPOS_SORTS)
         page_number_raw = self.request.GET.get("page_num", 1)
         page_size_raw = self.request.GET.get("page_size", 10)
         try:
@@ -73,23 +235,207 @@ class GitHubReposView(LoginRequiredMixin, TemplateView):
         except (ValueError, TypeError):
             raise Http404("Not found")
 
-        paginator = Paginator(repos_list, page_size)
-        try:
-            page_obj = paginator.page(page_number)
-        except (EmptyPage, PageNotAnInteger):
-            raise Http404("Not found")
+        after = self.request.GET.get("after")
+        before = self.request.GET.get("before")
+        state = get_sync_state(self.request)
+        cache_key = None
+        page_obj = None
+        if state is not None:
+            page_key = hashlib.sha256(self.request.get_full_path().encode()).hexdigest()
+            cache_key = f"github-repos-page:{state.user_id}:{state.repo_version}:{page_key}"
+            page_obj = cache.get(cache_key)
+        if page_obj is None:
+            page_obj = self.get_page(page_number, page_size, after, before)
+            if cache_key is not None:
+                cache.set(cache_key, page_obj, settings.REPOS_PAGE_CACHE_TIMEOUT)
 
         context["page_number"] = page_number
         context["repos"] = page_obj
         return context
 
+    def filter_query(self) -> str:
+        """The current filters as a query string, for the pagination links."""
+        params = self.request.GET.copy()
+        for name in ("page_num", "after", "before"):
+            params.pop(name, None)
+        return params.urlencode()
+
+    def get_page(self, page_number: int, page_size: int, after: Optional[str], before: Optional[str]) -> KeysetPage:
+        try:
+            ordering = repos_ordering(self.request.GET)
+            links_qs = filter_repo_rows(repo_rows(self.request.user), self.request.GET)
+            paginator = KeysetPaginator(links_qs, ordering, page_size)
+            return paginator.page(page_number, after=after, before=before)
+        except ValueError:
+            raise Http404("Not found")
+
 
 @login_required
 @require_POST
-@ratelimit(key="user", rate="1/m", block=True)
+@ratelimit(key="user", rate="1/m", block=False)
 def trigger_sync_repos(request: HttpRequest) -> HttpResponse:
-    sync_repos_task.delay(request.user.id)
+    if request.limited:
+        # A 429 rather than django_ratelimit's 403, so throttled triggers are told apart from refused ones.
+        return api_error("Sync was triggered less than a minute ago.", HTTPStatus.TOO_MANY_REQUESTS)
+    task_id, queued = enqueue_sync(request.user.id)
+    return JsonResponse({"task_id": task_id, "queued": queued}, status=HTTPStatus.ACCEPTED)
+
+
+def api_error(message: str, status: int = HTTPStatus.BAD_REQUEST) -> JsonResponse:
+    return JsonResponse({"error": message}, status=status)
+
+
+@gzip_page
+@require_GET
+def github_repos_api(request: HttpRequest) -> HttpResponse:
+    """JSON listing of the user's repos, paged by ``after``/``before`` cursors.
+
+    ``fields`` is a comma separated subset of ``REPOS_API_FIELDS``; only those columns are selected.
+    """
+    if not request.user.is_authenticated:
+        return api_error("Authentication required.", HTTPStatus.UNAUTHORIZED)
+    return repos_api_response(request)
+
+
+@condition(etag_func=repos_api_etag, last_modified_func=repos_last_modified)
+def repos_api_response(request: HttpRequest) -> HttpResponse:
+    try:
+        fields = requested_fields(request.GET)
+    except ValueError as exc:
+        return api_error(f"{exc}.")
+    try:
+        page_size = int(request.GET.get("page_size", REPOS_API_DEFAULT_PAGE_SIZE))
+    except ValueError:
+        page_size = 0
+    if not 1 <= page_size <= REPOS_API_MAX_PAGE_SIZE:
+        return api_error(f"page_size must be between 1 and {REPOS_API_MAX_PAGE_SIZE}.")
+
+    state = get_sync_state(request)
+    cache_key = None
+    if state is not None:
+        path_key = hashlib.sha256(request.get_full_path().encode()).hexdigest()
+        cache_key = f"github-repos-api:{state.user_id}:{state.repo_version}:{path_key}"
+        body = cache.get(cache_key)
+        if body is not None:
+            return HttpResponse(body, content_type="application/json")
+
+    try:
+        ordering = repos_ordering(request.GET)
+        rows_qs = filter_repo_rows(repo_api_rows(request.user, fields, ordering), request.GET)
+        paginator = KeysetPaginator(rows_qs, ordering, page_size)
+        page = paginator.page(1, after=request.GET.get("after"), before=request.GET.get("before"))
+    except ValueError as exc:
+        return api_error(f"{exc}.")
+
+    rows = page.object_list
+    if rows and set(rows[0]) != set(fields):
+        rows = [{name: row[name] for name in fields} for row in rows]
+    body = json.dumps(
+        {
+            "results": rows,
+            "next": page_url(request, "after", page.next_cursor) if page.has_next() else None,
+            "previous": page_url(request, "before", page.previous_cursor) if page.has_previous() else None,
+        },
+        separators=(",", ":"),
+    )
+    if cache_key is not None:
+        cache.set(cache_key, body, settings.REPOS_PAGE_CACHE_TIMEOUT)
+    return HttpResponse(body, content_type="application/json")
+
+
+@gzip_page
+@require_GET
+def github_repos_export(request: HttpRequest) -> HttpResponse:
+    """Every repo of the user, with the listing filters and sort, streamed as CSV or NDJSON.
+
+    Rows come from a server-side cursor and are written out chunk by chunk, so memory does not
+    grow with the export and the header goes out before the query has run.
+    """
+    if not request.user.is_authenticated:
+        return api_error("Authentication required.", HTTPStatus.UNAUTHORIZED)
+    export_format = request.GET.get("format", "csv")
+    if export_format not in REPOS_EXPORT_FORMATS:
+        return api_error(f"format must be one of: {', '.join(REPOS_EXPORT_FORMATS)}.")
+    try:
+        fields = requested_fields(request.GET)
+        ordering = repos_ordering(request.GET)
+        rows_qs = filter_repo_rows(repo_api_rows(request.user, fields, ordering), request.GET)
+    except ValueError as exc:
+        return api_error(f"{exc}.")
+    rows = rows_qs.order_by(*ordering).values_list(*fields).iterator(chunk_size=REPOS_EXPORT_CHUNK_SIZE)
+    encode = csv_lines if export_format == "csv" else ndjson_lines
+    response = StreamingHttpResponse(encode(fields, rows), content_type=REPOS_EXPORT_FORMATS[export_format])
+    response["Content-Disposition"] = f'attachment; filename="repos.{export_format}"'
+    return response
+
+
+class EchoBuffer:
+    """File-like object that hands back what ``csv.writer`` writes instead of storing it."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def csv_lines(fields: List[str], rows: Iterator[tuple]) -> Iterator[str]:
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(fields)
+    for chunk in batched(rows, REPOS_EXPORT_CHUNK_SIZE):
+        yield "".join(writer.writerow(row) for row in chunk)
+
+
+def ndjson_lines(fields: List[str], rows: Iterator[tuple]) -> Iterator[str]:
+    # An empty first chunk makes the response start before the query has run, as the CSV header does.
+    yield ""
+    for chunk in batched(rows, REPOS_EXPORT_CHUNK_SIZE):
+        yield "".join(json.dumps(dict(zip(fields, row))) + "\n" for row in chunk)
+
+
+def page_url(request: HttpRequest, direction: str, cursor: str) -> str:
+    query = request.GET.copy()
+    query.pop("after", None)
+    query.pop("before", None)
+    query[direction] = cursor
+    return f"{request.path}?{query.urlencode()}"
+
+
+@csrf_exempt
+@require_POST
+def github_webhook(request: HttpRequest) -> HttpResponse:
+    """Verify and queue a GitHub webhook delivery; ``apply_webhook_events`` writes it in a batch later.
+
+    The work per delivery is fixed: one signature check, one insert and one cache write.
+    """
+    secret = settings.GITHUB_WEBHOOK_SECRET
+    if not secret:
+        raise Http404("Not found")
+    if not verify_signature(secret, request.body, request.headers.get("X-Hub-Signature-256")):
+        return api_error("Invalid signature.", HTTPStatus.FORBIDDEN)
+    event = request.headers.get("X-GitHub-Event", "")
+    if event == "ping":
+        return JsonResponse({"ok": True})
+    if event not in WEBHOOK_EVENTS:
+        return HttpResponse(status=HTTPStatus.NO_CONTENT)
+    delivery_id = request.headers.get("X-GitHub-Delivery")
+    if not delivery_id:
+        return api_error("Missing X-GitHub-Delivery header.")
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return api_error("Payload must be JSON.")
+    if not isinstance(payload, dict):
+        return api_error("Payload must be a JSON object.")
+    GitHubWebhookEvent.objects.bulk_create(
+        [GitHubWebhookEvent(delivery_id=delivery_id, event=event, payload=payload)], ignore_conflicts=True
+    )
+    enqueue_webhook_apply()
     return HttpResponse(status=HTTPStatus.ACCEPTED)
 
 
+def metrics(request: HttpRequest) -> HttpResponse:
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=HTTPStatus.UNAUTHORIZED)
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
 # TODO sertbot queries db and all
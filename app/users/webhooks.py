@@ -0,0 +1,178 @@
+"""GitHub webhook deliveries: signature checks and the batched apply of queued events.
+
+The receiver only verifies and queues a delivery; ``apply_webhook_events`` later folds a batch
+of events into at most one write per repo.
+"""
+
+import hashlib
+import hmac
+import logging
+from collections import Counter
+from collections import defaultdict
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+
+from allauth.socialaccount.models import SocialAccount
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
+
+from .models import GitHubRepo
+from .models import GitHubSyncState
+from .models import GitHubWebhookEvent
+from .models import UserGitHubRepo
+from .sync import refresh_summaries
+from .sync import upsert_links
+from .sync import upsert_repos
+
+WEBHOOK_EVENTS = ("repository", "star", "fork")
+
+# Bounds of Postgres integer and bigint columns.
+INT_MAX = 2**31 - 1
+BIGINT_MAX = 2**63 - 1
+
+logger = logging.getLogger(__name__)
+
+
+def sign_payload(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Check ``X-Hub-Signature-256``; the comparison takes the same time whatever the mismatch."""
+    return bool(secret and signature) and constant_time_compare(sign_payload(secret, body), signature)
+
+
+def is_int(value: Any, maximum: int = BIGINT_MAX) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and -maximum <= value <= maximum
+
+
+def is_text(value: Any, max_length: Optional[int] = None) -> bool:
+    return isinstance(value, str) and "\x00" not in value and (max_length is None or len(value) <= max_length)
+
+
+def is_timestamp(value: Any) -> bool:
+    try:
+        return isinstance(value, str) and parse_datetime(value) is not None
+    except ValueError:
+        return False
+
+
+def usable_repo(repo: Any) -> bool:
+    """Whether a webhook ``repository`` can be written by ``upsert_repos`` without failing the whole batch."""
+    if not isinstance(repo, dict) or not is_int(repo.get("id")):
+        return False
+    for name in ("name", "full_name", "html_url", "language"):
+        if repo.get(name) is not None and not is_text(repo[name], GitHubRepo._meta.get_field(name).max_length):
+            return False
+    if repo.get("description") is not None and not is_text(repo["description"]):
+        return False
+    for name in ("stargazers_count", "forks_count"):
+        if repo.get(name) is not None and not is_int(repo[name], INT_MAX):
+            return False
+    for name in ("updated_at", "pushed_at"):
+        if repo.get(name) is not None and not is_timestamp(repo[name]):
+            return False
+    if "private" in repo and not isinstance(repo["private"], bool):
+        return False
+    owner = repo.get("owner")
+    return owner is None or isinstance(owner, dict) and is_int(owner.get("id"))
+
+
+@dataclass
+class WebhookBatch:
+    """Queued events folded per repo: the latest payload of each repo wins, a deletion drops it."""
+
+    repos: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    deleted: Set[int] = field(default_factory=set)
+    # github_id -> GitHub user id of a new owner, whose local account (if any) gets linked to the repo.
+    owners: Dict[int, str] = field(default_factory=dict)
+    # Events left out because their payload could not be written.
+    dropped: int = 0
+
+    def add_repo(self, repo: Dict[str, Any], link_owner: bool = False) -> None:
+        self.repos[repo["id"]] = repo
+        self.deleted.discard(repo["id"])
+        if link_owner and repo.get("owner"):
+            self.owners[repo["id"]] = str(repo["owner"]["id"])
+
+    def delete_repo(self, repo: Dict[str, Any]) -> None:
+        self.repos.pop(repo["id"], None)
+        self.owners.pop(repo["id"], None)
+        self.deleted.add(repo["id"])
+
+
+def coalesce_events(events: Iterable[GitHubWebhookEvent]) -> WebhookBatch:
+    """Fold events, oldest first, into one batch.
+
+    Events whose repos could not be written are dropped and counted in ``dropped``: the batch is written
+    in one transaction, so a single bad payload would otherwise fail every run that claims it.
+    """
+    batch = WebhookBatch()
+    for event in events:
+        payload = event.payload
+        repo = payload.get("repository")
+        if not repo:
+            continue
+        forkee = payload.get("forkee") if event.event == "fork" else None
+        deleted = event.event == "repository" and payload.get("action") == "deleted"
+        if deleted:
+            usable = isinstance(repo, dict) and is_int(repo.get("id"))
+        else:
+            usable = usable_repo(repo) and (not forkee or usable_repo(forkee))
+        if not usable:
+            logger.warning("webhooks: dropping unusable %s delivery %s", event.event, event.delivery_id)
+            batch.dropped += 1
+        elif deleted:
+            batch.delete_repo(repo)
+        elif event.event == "repository":
+            batch.add_repo(repo, link_owner=payload.get("action") in ("created", "transferred"))
+        elif event.event == "star":
+            batch.add_repo(repo)
+        elif event.event == "fork":
+            # The source repo carries the new forks_count; the fork itself belongs to whoever forked it.
+            batch.add_repo(repo)
+            if forkee:
+                batch.add_repo(forkee, link_owner=True)
+    return batch
+
+
+def apply_events(events: List[GitHubWebhookEvent]) -> Counter:
+    """Write a batch of events to repos and links; the caller owns the transaction."""
+    batch = coalesce_events(events)
+    # Webhook payloads are newer than anything a sync wrote, so recently refreshed rows are not skipped.
+    created, updated_ids = upsert_repos(batch.repos.values(), refresh_ttl=0)
+
+    changed_users = set()
+    linked = 0
+    repos_by_user = defaultdict(list)
+    accounts = SocialAccount.objects.filter(provider="github", uid__in=set(batch.owners.values()))
+    user_by_uid = dict(accounts.values_list("uid", "user_id"))
+    for github_id, uid in batch.owners.items():
+        if uid in user_by_uid:
+            repos_by_user[user_by_uid[uid]].append(github_id)
+    for user_id, github_ids in repos_by_user.items():
+        count = upsert_links(user_id, github_ids)
+        if count:
+            linked += count
+            changed_users.add(user_id)
+
+    disabled = 0
+    if batch.deleted:
+        links = UserGitHubRepo.objects.filter(repo__github_id__in=batch.deleted, disabled=False)
+        changed_users.update(links.values_list("user_id", flat=True))
+        disabled = links.update(disabled=True, disabled_at=timezone.now())
+
+    if updated_ids:
+        # Like a sync, an updated shared repo changes the listing, and the totals, of everyone linked to it.
+        changed_users.update(UserGitHubRepo.objects.filter(repo_id__in=updated_ids).values_list("user_id", flat=True))
+    if changed_users:
+        GitHubSyncState.bump(changed_users)
+        refresh_summaries(sorted(changed_users))
+    return Counter(created=created, updated=len(updated_ids), linked=linked, disabled=disabled, dropped=batch.dropped)